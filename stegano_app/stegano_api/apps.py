@@ -1,6 +1,21 @@
+import os
+import sys
 from django.apps import AppConfig
 
+# Add the repository root to sys.path so stegano_toolkit is importable from
+# every process that loads the app (web workers and Celery workers alike)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
 
 class SteganoApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'stegano_api'
+    
+    def ready(self):
+        from . import signals  # noqa: F401
+        
+        # Point the keyring at the key directory; it is only decrypted when
+        # a key is first used, so management commands never read it
+        from django.conf import settings
+        from stegano_toolkit.common_crypto import KeyManager
+        KeyManager.configure_keyring(settings.KEY_STORAGE_DIR, settings.KEY_MASTER_KEY)
@@ -0,0 +1,46 @@
+"""
+Per-user caching of list responses for the steganography API.
+
+Each (prefix, user) pair has a version number that is part of every cache
+key. Bumping the version on writes makes all stale list entries unreachable
+without having to enumerate them.
+
+The versions are bumped from model signals in whichever process saves the
+row, Celery workers included, so the cache backend must be shared between
+processes (see CACHES in settings).
+"""
+
+from django.core.cache import cache
+
+# Lifetime of a cached list response in seconds
+LIST_CACHE_TIMEOUT = 30
+
+
+def _version_key(prefix, user_id):
+    return f"{prefix}_list_version_{user_id}"
+
+
+def get_list_version(prefix, user_id):
+    """Get the current list cache version for a user."""
+    return cache.get_or_set(_version_key(prefix, user_id), 1, None)
+
+
+def bump_list_version(prefix, user_id):
+    """Invalidate all cached lists of the given prefix for a user."""
+    key = _version_key(prefix, user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Key missing or evicted; any fresh value invalidates old entries
+        cache.set(key, 2, None)
+
+
+def list_cache_key(prefix, user_id, origin, query_string):
+    """
+    Build the cache key for a user's list response.
+    
+    Lists contain absolute URLs (file links, pagination), so the scheme and
+    host the request came in on are part of the key.
+    """
+    version = get_list_version(prefix, user_id)
+    return f"{prefix}_list_{user_id}_v{version}_{origin}_{query_string}"
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stegano_api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediafile',
+            name='task_id',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
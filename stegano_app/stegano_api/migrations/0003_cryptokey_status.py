@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stegano_api', '0002_mediafile_task_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cryptokey',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='ready', max_length=20),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.15 on 2026-10-15 03:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stegano_api', '0003_cryptokey_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cryptokey',
+            index=models.Index(fields=['user', '-created_at'], name='stegano_api_user_id_fe4655_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mediafile',
+            index=models.Index(fields=['user', '-created_at'], name='stegano_api_user_id_a81453_idx'),
+        ),
+    ]
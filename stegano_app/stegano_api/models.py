@@ -19,8 +19,16 @@ class CryptoKey(models.Model):
         ('exchange', 'Exchange Key'),
         ('signing', 'Signing Key'),
     ])
+    status = models.CharField(max_length=20, default='ready', choices=[
+        ('pending', 'Pending'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ])
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [models.Index(fields=['user', '-created_at'])]
+    
     def __str__(self):
         return f"{self.name} ({self.key_type}) - {self.user.username}"
     
@@ -50,7 +58,11 @@ class MediaFile(models.Model):
     watermarked_file = models.FileField(upload_to='watermarked/', null=True, blank=True)
     message = models.TextField(null=True, blank=True)
     key = models.ForeignKey(CryptoKey, on_delete=models.SET_NULL, null=True, blank=True, related_name='files')
+    task_id = models.CharField(max_length=255, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [models.Index(fields=['user', '-created_at'])]
+    
     def __str__(self):
         return f"{self.file_name} - {self.user.username}"
@@ -2,6 +2,9 @@
 Serializers for the steganography API.
 """
 
+import copy
+import threading
+import serpy
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import CryptoKey, MediaFile
@@ -33,16 +36,52 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         return user
 
 
-class CryptoKeySerializer(serializers.ModelSerializer):
+class CachedFieldsMixin:
+    """
+    Build a ModelSerializer's field map once per class.
+    
+    Model introspection runs on the first instantiation only; later
+    instances get a deep copy, since DRF binds fields to their parent.
+    """
+    _cached_fields = None
+    _cached_fields_lock = threading.Lock()
+    
+    def get_fields(self):
+        cls = self.__class__
+        # Look in the class's own namespace so subclasses get their own cache
+        if cls.__dict__.get('_cached_fields') is None:
+            with cls._cached_fields_lock:
+                if cls.__dict__.get('_cached_fields') is None:
+                    cls._cached_fields = super().get_fields()
+        return copy.deepcopy(cls._cached_fields)
+
+
+class CryptoKeySerializer(CachedFieldsMixin, serializers.ModelSerializer):
     """Serializer for CryptoKey model."""
     
     class Meta:
         model = CryptoKey
-        fields = ['id', 'name', 'key_type', 'created_at']
-        read_only_fields = ['id', 'created_at']
+        fields = ['id', 'name', 'key_type', 'status', 'created_at']
+        read_only_fields = ['id', 'status', 'created_at']
 
 
-class MediaFileSerializer(serializers.ModelSerializer):
+# Shared formatter so hand-built list output renders datetimes like DRF
+list_datetime_field = serializers.DateTimeField()
+
+
+class CryptoKeyListSerializer(serpy.Serializer):
+    """Read-only serpy serializer producing CryptoKeySerializer's list output."""
+    id = serpy.StrField()
+    name = serpy.StrField()
+    key_type = serpy.StrField()
+    status = serpy.StrField()
+    created_at = serpy.MethodField()
+    
+    def get_created_at(self, obj):
+        return list_datetime_field.to_representation(obj.created_at)
+
+
+class MediaFileSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     """Serializer for MediaFile model."""
     key = CryptoKeySerializer(read_only=True)
     key_id = serializers.UUIDField(write_only=True, required=False)
@@ -55,19 +94,15 @@ class MediaFileSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         key_id = validated_data.pop('key_id', None)
-        user = self.context['request'].user
+        # perform_create passes the user through save()
+        user = validated_data.pop('user', None) or self.context['request'].user
+        
+        # Only link keys owned by the user; set the FK in the INSERT itself
+        if key_id and not CryptoKey.objects.filter(id=key_id, user=user).exists():
+            key_id = None
         
-        media_file = MediaFile.objects.create(
+        return MediaFile.objects.create(
             user=user,
+            key_id=key_id,
             **validated_data
-        )
-        
-        if key_id:
-            try:
-                key = CryptoKey.objects.get(id=key_id, user=user)
-                media_file.key = key
-                media_file.save()
-            except CryptoKey.DoesNotExist:
-                pass
-        
-        return media_file
\ No newline at end of file
+        )
\ No newline at end of file
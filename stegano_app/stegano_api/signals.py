@@ -0,0 +1,23 @@
+"""
+Signal handlers for the steganography API.
+"""
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .caching import bump_list_version
+from .models import CryptoKey, MediaFile
+
+
+@receiver([post_save, post_delete], sender=MediaFile)
+def invalidate_file_lists(sender, instance, **kwargs):
+    """Drop cached file lists when one of the user's files changes."""
+    bump_list_version('files', instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=CryptoKey)
+def invalidate_key_lists(sender, instance, **kwargs):
+    """Drop cached key and file lists when one of the user's keys changes."""
+    bump_list_version('keys', instance.user_id)
+    # File lists embed the key, so they are stale too
+    bump_list_version('files', instance.user_id)
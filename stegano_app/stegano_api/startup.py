@@ -0,0 +1,31 @@
+"""
+Start-up work for processes that serve requests or run tasks.
+
+AppConfig.ready() also runs for every management command (migrate, shell,
+test), so anything only a serving process needs lives here instead. The
+WSGI and ASGI modules call prepare_process() once the app registry is
+ready, and Celery calls it from worker_process_init.
+"""
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+def prepare_process():
+    """Check the configuration a serving process depends on and warm it up."""
+    # Every embed, extract and key download needs the keyring, so fail at
+    # start-up rather than on the first request
+    if not settings.KEY_MASTER_KEY:
+        raise ImproperlyConfigured("The STEGANO_KEY_MASTER_KEY environment variable must be set")
+    
+    # Compile the audio and image QIM kernels now so the first request
+    # doesn't pay for it
+    from stegano_toolkit._audio_kernels import warm_up
+    warm_up()
+    from stegano_toolkit._image_kernels import warm_up as warm_up_image
+    warm_up_image()
+    
+    # Same for the vectorized Reed-Solomon codec, when galois is installed.
+    # This has to run on the main thread, which both callers are on
+    from stegano_toolkit._rs_codec import warm_up as warm_up_rs
+    warm_up_rs()
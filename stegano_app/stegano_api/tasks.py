@@ -0,0 +1,90 @@
+"""
+Celery tasks for the steganography API.
+"""
+
+import os
+from celery import shared_task
+from django.conf import settings
+
+from stegano_toolkit.common_crypto import KeyManager, PayloadProcessor
+from stegano_toolkit._fileio import atomic_output
+
+from .models import CryptoKey, MediaFile
+
+# Queue routing by media type: audio/video are CPU-heavy
+HEAVY_FILE_TYPES = ('audio', 'video')
+
+
+def queue_for(file_type):
+    """Get the Celery queue that should process the given file type."""
+    return 'heavy' if file_type in HEAVY_FILE_TYPES else 'light'
+
+
+@shared_task
+def embed_task(media_file_id, key_id, message):
+    """Embed a message in a media file and store the watermarked result."""
+    from .views import get_steganography_handler
+    
+    media_file = MediaFile.objects.get(id=media_file_id)
+    key_obj = CryptoKey.objects.get(id=key_id, user=media_file.user)
+    
+    # Read the key
+    key = KeyManager.get_key(key_obj.id)
+    
+    # Process the payload
+    payload, _ = PayloadProcessor.prepare_payload(message.encode('utf-8'), key)
+    
+    # Get the appropriate handler
+    handler = get_steganography_handler(media_file.file_type)
+    
+    # Write the result straight to its final place under MEDIA_ROOT, named
+    # after the format the handler actually writes
+    ext = handler.output_extension(media_file.original_file.name)
+    relative_path = f"watermarked/wm_{media_file.id}{ext}"
+    output_path = os.path.join(settings.MEDIA_ROOT, relative_path)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    
+    # Embed the payload, letting the handler read the original from disk
+    # and write the result into the output file; it only replaces
+    # output_path once the embed has succeeded
+    with atomic_output(output_path) as f:
+        handler.embed_to(f, media_file.original_file.path, payload, key)
+    
+    # Update the media file record; task_id may still be in flight from the view
+    media_file.watermarked_file.name = relative_path
+    media_file.message = message
+    media_file.key = key_obj
+    media_file.save(update_fields=['watermarked_file', 'message', 'key'])
+    
+    return str(media_file.id)
+
+
+@shared_task
+def generate_key_task(key_id):
+    """Generate the key material for a pending key and mark it ready."""
+    key_instance = CryptoKey.objects.get(id=key_id)
+    key_type = key_instance.key_type
+    
+    try:
+        # Generate and save the actual key
+        if key_type == 'session':
+            key = KeyManager.generate_session_key()
+            KeyManager.store_key(key_instance.id, key)
+        elif key_type in ['exchange', 'signing']:
+            if key_type == 'exchange':
+                private_key, public_key = KeyManager.generate_keypair()
+            else:  # signing
+                private_key, public_key = KeyManager.generate_signing_keypair()
+                
+            KeyManager.store_key(key_instance.id, private_key)
+            with open(key_instance.public_key_path(), 'wb') as f:
+                f.write(public_key)
+    except Exception:
+        key_instance.status = 'failed'
+        key_instance.save(update_fields=['status'])
+        raise
+    
+    key_instance.status = 'ready'
+    key_instance.save(update_fields=['status'])
+    
+    return str(key_instance.id)
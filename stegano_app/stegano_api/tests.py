@@ -1,3 +1,268 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from PIL import Image
+from cryptography.fernet import Fernet
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from stegano_toolkit.common_crypto import KeyManager
+
+from .models import CryptoKey, MediaFile
+from .startup import prepare_process
+from .tasks import embed_task
+
+# Keep tests off any shared cache configured through CACHE_URL
+LOCAL_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class APITestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class KeyCreationTests(APITestCase):
+
+    @mock.patch('stegano_api.views.generate_key_task.delay')
+    def test_generation_is_queued_after_commit(self, delay):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            response = self.client.post('/api/keys/', {'name': 'k', 'key_type': 'session'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        delay.assert_not_called()
+
+        for callback in callbacks:
+            callback()
+        delay.assert_called_once_with(response.data['id'])
+        self.assertEqual(CryptoKey.objects.get(id=response.data['id']).status, 'pending')
+
+    @mock.patch('stegano_api.views.generate_key_task.delay', side_effect=ConnectionError('broker down'))
+    def test_key_is_failed_when_queueing_fails(self, delay):
+        with self.assertLogs('stegano_api.views', level='ERROR'):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/keys/', {'name': 'k', 'key_type': 'session'}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(CryptoKey.objects.get(id=response.data['id']).status, 'failed')
+
+
+class ListCacheTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.key = CryptoKey.objects.create(user=self.user, name='k', key_type='session', status='pending')
+
+    def key_statuses(self):
+        return [key['status'] for key in self.client.get('/api/keys/').data]
+
+    def test_list_is_served_from_cache(self):
+        self.assertEqual(self.key_statuses(), ['pending'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.key_statuses(), ['pending'])
+
+    def test_save_invalidates_list(self):
+        self.assertEqual(self.key_statuses(), ['pending'])
+
+        self.key.status = 'ready'
+        self.key.save(update_fields=['status'])
+
+        self.assertEqual(self.key_statuses(), ['ready'])
+
+    def test_delete_invalidates_list(self):
+        self.assertEqual(len(self.key_statuses()), 1)
+        self.key.delete()
+        self.assertEqual(self.key_statuses(), [])
+
+    def test_lists_are_per_user(self):
+        self.assertEqual(len(self.key_statuses()), 1)
+        other = User.objects.create_user('bob', 'bob@example.com', 'password')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.key_statuses(), [])
+
+
+class FileListTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.key = CryptoKey.objects.create(user=self.user, name='k', key_type='session', status='pending')
+        self.media_file = MediaFile.objects.create(
+            user=self.user, file_name='a.png', file_type='image', original_file='originals/a.png',
+            watermarked_file='watermarked/wm_a.png', message='not listed', key=self.key
+        )
+
+    def test_rows_match_detail_without_message(self):
+        row = self.client.get('/api/files/').data[0]
+        detail = dict(self.client.get(f'/api/files/{self.media_file.id}/').data)
+
+        self.assertEqual(detail.pop('message'), 'not listed')
+        self.assertEqual(row, detail)
+
+    @override_settings(ALLOWED_HOSTS=['localhost', 'internal'])
+    def test_urls_follow_request_origin(self):
+        internal = self.client.get('/api/files/', HTTP_HOST='internal').data[0]
+        public = self.client.get('/api/files/', HTTP_HOST='localhost', secure=True).data[0]
+
+        self.assertEqual(internal['original_file'], 'http://internal/media/originals/a.png')
+        self.assertEqual(public['original_file'], 'https://localhost/media/originals/a.png')
+
+    def test_key_change_invalidates_file_list(self):
+        self.assertEqual(self.client.get('/api/files/').data[0]['key']['status'], 'pending')
+
+        self.key.status = 'ready'
+        self.key.save(update_fields=['status'])
+
+        self.assertEqual(self.client.get('/api/files/').data[0]['key']['status'], 'ready')
+
+
+class UserStatsTests(APITestCase):
+
+    def test_counts_only_own_rows(self):
+        key = CryptoKey.objects.create(user=self.user, name='k', key_type='session')
+        CryptoKey.objects.create(user=self.user, name='k2', key_type='session')
+        for name in ('a.png', 'b.png', 'c.png'):
+            MediaFile.objects.create(user=self.user, file_name=name, file_type='image',
+                                     original_file=f'originals/{name}', key=key)
+        other = User.objects.create_user('bob', 'bob@example.com', 'password')
+        CryptoKey.objects.create(user=other, name='k', key_type='session')
+
+        response = self.client.get('/api/user/stats/')
+
+        self.assertEqual(response.data['file_count'], 3)
+        self.assertEqual(response.data['key_count'], 2)
+        self.assertEqual(response.data['username'], 'alice')
+
+
+class MediaTestCase(APITestCase):
+    """Runs against a temporary MEDIA_ROOT and keyring holding one ready session key."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        # Keep test keys out of the real keyring directory; tests need no
+        # STEGANO_KEY_MASTER_KEY
+        key_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, key_dir)
+        KeyManager.configure_keyring(key_dir, Fernet.generate_key())
+        self.addCleanup(KeyManager.configure_keyring, settings.KEY_STORAGE_DIR, settings.KEY_MASTER_KEY)
+
+        self.key = CryptoKey.objects.create(user=self.user, name='k', key_type='session')
+        KeyManager.store_key(self.key.id, KeyManager.generate_session_key())
+
+    def jpeg_upload(self, size):
+        rng = np.random.default_rng(0)
+        buffer = io.BytesIO()
+        Image.fromarray(rng.integers(40, 216, (*size, 3)).astype(np.uint8)).save(buffer, format='JPEG')
+        return SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def upload_jpeg(self, size):
+        return MediaFile.objects.create(user=self.user, file_name='photo.jpg', file_type='image',
+                                        original_file=self.jpeg_upload(size))
+
+    def watermarked_dir(self):
+        return os.listdir(os.path.join(self.media_root, 'watermarked'))
+
+
+class EmbedTaskTests(MediaTestCase):
+
+    def test_output_is_named_after_handler_format(self):
+        media_file = self.upload_jpeg((203, 301))
+
+        embed_task(str(media_file.id), str(self.key.id), 'hidden message')
+
+        media_file.refresh_from_db()
+        self.assertEqual(media_file.watermarked_file.name, f'watermarked/wm_{media_file.id}.png')
+        self.assertEqual(self.watermarked_dir(), [f'wm_{media_file.id}.png'])
+        with media_file.watermarked_file.open('rb') as f:
+            self.assertEqual(f.read(8), b'\x89PNG\r\n\x1a\n')
+
+        response = self.client.post(f'/api/files/{media_file.id}/extract/')
+        self.assertEqual(response.data['message'], 'hidden message')
+
+        download = self.client.get(f'/api/files/{media_file.id}/download_watermarked/')
+        self.assertIn('watermarked_photo.png', download['Content-Disposition'])
+
+    def test_failed_embed_leaves_no_output(self):
+        media_file = self.upload_jpeg((16, 16))
+
+        with self.assertRaises(ValueError):
+            embed_task(str(media_file.id), str(self.key.id), 'too long for the image ' * 10)
+
+        media_file.refresh_from_db()
+        self.assertFalse(media_file.watermarked_file)
+        self.assertEqual(self.watermarked_dir(), [])
+
+
+class ProcessFileTests(MediaTestCase):
+
+    def process(self, operation, upload, **data):
+        return self.client.post('/api/files/process/', {
+            'operation': operation, 'file': upload, 'key_id': str(self.key.id), **data
+        }, format='multipart')
+
+    @mock.patch('stegano_api.views.embed_task.apply_async')
+    def test_embed_stores_upload_and_queues_task(self, apply_async):
+        apply_async.return_value.id = 'task-1'
+
+        response = self.process('embed', self.jpeg_upload((64, 64)), message='hello')
+
+        self.assertEqual(response.status_code, 202)
+        media_file = MediaFile.objects.get(id=response.data['id'])
+        self.assertEqual(media_file.file_name, 'photo.jpg')
+        self.assertEqual(media_file.task_id, 'task-1')
+        apply_async.assert_called_once_with(
+            args=[str(media_file.id), str(self.key.id), 'hello'], queue='light'
+        )
+
+    def test_embed_then_extract_and_download(self):
+        media_file = self.upload_jpeg((203, 301))
+        embed_task(str(media_file.id), str(self.key.id), 'round trip')
+
+        download = self.client.get(f'/api/files/{media_file.id}/download/')
+        self.assertIn('watermarked_photo.png', download['Content-Disposition'])
+        stego_png = b''.join(download.streaming_content)
+
+        upload = SimpleUploadedFile('photo.png', stego_png, content_type='image/png')
+        response = self.process('extract', upload)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['message'], 'round trip')
+        # Extraction does not store the upload
+        self.assertEqual(MediaFile.objects.count(), 1)
+
+    def test_embed_without_message_stores_nothing(self):
+        response = self.process('embed', self.jpeg_upload((64, 64)))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(MediaFile.objects.exists())
+
+    def test_download_before_embed_fails(self):
+        media_file = self.upload_jpeg((64, 64))
+        response = self.client.get(f'/api/files/{media_file.id}/download/')
+        self.assertEqual(response.status_code, 400)
+
+
+class StartupTests(TestCase):
+
+    @override_settings(KEY_MASTER_KEY=None)
+    def test_serving_process_requires_master_key(self):
+        with self.assertRaises(ImproperlyConfigured):
+            prepare_process()
+
+    @override_settings(KEY_MASTER_KEY='configured')
+    def test_serving_process_starts_with_master_key(self):
+        prepare_process()
@@ -15,13 +15,15 @@ router.register(r'users', UserViewSet, basename='user')
 router.register(r'keys', CryptoKeyViewSet, basename='key')
 router.register(r'files', MediaFileViewSet, basename='file')
 
-# The API URLs are determined automatically by the router
+# The API URLs are determined automatically by the router. The explicit
+# paths come first: the router's files/<pk>/ route would otherwise take
+# files/process/ as a file id
 urlpatterns = [
-    path('', include(router.urls)),
     path('auth/login/', CustomAuthToken.as_view(), name='api_token_auth'),
     path('auth/register/', UserViewSet.as_view({'post': 'create'}), name='register'),
     path('auth/user/', UserViewSet.as_view({'get': 'me'}), name='current_user'),
     path('user/stats/', user_stats, name='user_stats'),
     path('files/process/', process_file, name='process_file'),
     path('files/<uuid:pk>/download/', download_file, name='download_file'),
+    path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -2,11 +2,14 @@
 Views for the steganography API.
 """
 
+import io
 import os
 import sys
-import tempfile
-from django.conf import settings
+import logging
 from django.http import FileResponse
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import transaction
 from django.db.models import Count
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action, api_view, permission_classes
@@ -14,6 +17,7 @@ from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.parsers import MultiPartParser, FormParser
+from celery.result import AsyncResult
 
 # Add the parent directory to sys.path to import stegano_toolkit
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
@@ -26,22 +30,58 @@ from stegano_toolkit.document_stego import DocumentSteganography
 from .models import CryptoKey, MediaFile
 from .serializers import (
     UserSerializer, UserRegistrationSerializer,
-    CryptoKeySerializer, MediaFileSerializer
+    CryptoKeySerializer, MediaFileSerializer,
+    CryptoKeyListSerializer, list_datetime_field
 )
+from .tasks import embed_task, generate_key_task, queue_for
+from .caching import LIST_CACHE_TIMEOUT, list_cache_key
 from django.contrib.auth.models import User
 
+logger = logging.getLogger(__name__)
+
+# Read size used when streaming file downloads
+DOWNLOAD_BLOCK_SIZE = 1024 * 1024
+
+# Columns fetched for the media file list, including the nested key. The
+# message TextField can be large and is only returned by retrieve.
+MEDIA_FILE_LIST_VALUES = (
+    'id', 'file_name', 'file_type', 'original_file', 'watermarked_file',
+    'key__id', 'key__name', 'key__key_type', 'key__status', 'key__created_at', 'created_at'
+)
+
+# Media type of each upload extension accepted by process_file
+_EXT_MAP = {
+    '.jpg': 'image', '.jpeg': 'image', '.png': 'image', '.bmp': 'image', '.gif': 'image',
+    '.mp3': 'audio', '.wav': 'audio', '.ogg': 'audio',
+    '.mp4': 'video', '.avi': 'video', '.mov': 'video',
+    '.pdf': 'document', '.docx': 'document',
+}
+
+# Handlers keep no per-request state, so one instance per type is shared
+_document_handler = DocumentSteganography()
+_HANDLERS = {
+    'image': ImageSteganography(),
+    'audio': AudioSteganography(),
+    'video': VideoSteganography(),
+    'document': _document_handler,
+    'pdf': _document_handler,
+    'docx': _document_handler,
+}
+
 # User statistics endpoint
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def user_stats(request):
     """Get statistics for the current user."""
     user = request.user
-    file_count = MediaFile.objects.filter(user=user).count()
-    key_count = CryptoKey.objects.filter(user=user).count()
+    counts = User.objects.filter(pk=user.pk).aggregate(
+        file_count=Count('files', distinct=True),
+        key_count=Count('keys', distinct=True)
+    )
     
     return Response({
-        'file_count': file_count,
-        'key_count': key_count,
+        'file_count': counts['file_count'],
+        'key_count': counts['key_count'],
         'username': user.username,
         'email': user.email,
         'date_joined': user.date_joined
@@ -51,7 +91,7 @@ def user_stats(request):
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def process_file(request):
-    """Process a file with steganography (embed or extract)."""
+    """Embed a message in an uploaded file, or extract one from it, in one call."""
     operation = request.data.get('operation')
     file = request.FILES.get('file')
     key_id = request.data.get('key_id')
@@ -63,129 +103,105 @@ def process_file(request):
     if not key_id:
         return Response({"error": "No key provided"}, status=status.HTTP_400_BAD_REQUEST)
     
+    if operation not in ('embed', 'extract'):
+        return Response({"error": "Invalid operation"}, status=status.HTTP_400_BAD_REQUEST)
+    
+    if operation == 'embed' and not message:
+        return Response({"error": "No message provided for embedding"}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    
     try:
         key_obj = CryptoKey.objects.get(id=key_id, user=request.user)
     except CryptoKey.DoesNotExist:
         return Response({"error": "Key not found"}, status=status.HTTP_404_NOT_FOUND)
     
+    if key_obj.status != 'ready':
+        return Response({"error": "Key is not ready yet"}, status=status.HTTP_409_CONFLICT)
+    
     # Determine file type
-    filename = file.name.lower()
-    if filename.endswith(('.jpg', '.jpeg', '.png', '.bmp', '.gif')):
-        file_type = 'image'
-    elif filename.endswith(('.mp3', '.wav', '.ogg')):
-        file_type = 'audio'
-    elif filename.endswith(('.mp4', '.avi', '.mov')):
-        file_type = 'video'
-    elif filename.endswith(('.pdf', '.docx')):
-        file_type = 'document'
-    else:
+    file_type = _EXT_MAP.get(os.path.splitext(file.name.lower())[1])
+    if file_type is None:
         return Response({"error": "Unsupported file type"}, status=status.HTTP_400_BAD_REQUEST)
     
-    # Create a new media file record
-    media_file = MediaFile.objects.create(
-        user=request.user,
-        name=file.name,
-        file_type=file_type,
-        original_file=file
-    )
+    if operation == 'embed':
+        # Store the upload as a media file and embed on a worker, exactly as
+        # MediaFileViewSet.embed does for files uploaded beforehand
+        media_file = MediaFile.objects.create(
+            user=request.user,
+            file_name=file.name,
+            file_type=file_type,
+            original_file=file
+        )
+        task = queue_embed(media_file, key_obj, message)
+        return Response({"id": str(media_file.id), "task_id": task.id}, 
+                       status=status.HTTP_202_ACCEPTED)
     
-    # Process the file based on operation
     try:
-        with open(key_obj.key_path(), 'rb') as f:
-            key = f.read()
-        
+        key = KeyManager.get_key(key_obj.id)
         handler = get_steganography_handler(file_type)
         
-        if operation == 'embed':
-            if not message:
-                return Response({"error": "No message provided for embedding"}, 
-                               status=status.HTTP_400_BAD_REQUEST)
-            
-            # Process the payload
-            payload, _ = PayloadProcessor.prepare_payload(message.encode('utf-8'), key)
-            
-            # Create a temporary file for processing
-            with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                for chunk in file.chunks():
-                    temp_file.write(chunk)
-                temp_file_path = temp_file.name
-            
-            # Embed the payload
-            output_path = os.path.join(settings.MEDIA_ROOT, f"processed_{media_file.id}.{filename.split('.')[-1]}")
-            handler.embed(temp_file_path, output_path, payload)
-            
-            # Save the processed file
-            media_file.processed_file = f"processed_{media_file.id}.{filename.split('.')[-1]}"
-            media_file.save()
-            
-            # Clean up
-            os.unlink(temp_file_path)
-            
-            return Response({
-                "id": media_file.id,
-                "message": "File processed successfully",
-                "file_url": media_file.processed_file.url if media_file.processed_file else None
-            })
-        
-        elif operation == 'extract':
-            # Create a temporary file for processing
-            with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                for chunk in file.chunks():
-                    temp_file.write(chunk)
-                temp_file_path = temp_file.name
-            
-            # Extract the payload
-            extracted_payload = handler.extract(temp_file_path)
-            
-            # Decrypt the payload
-            decrypted_message = PayloadProcessor.process_payload(extracted_payload, key)
-            
-            # Clean up
-            os.unlink(temp_file_path)
-            
-            return Response({
-                "id": media_file.id,
-                "message": decrypted_message.decode('utf-8')
-            })
+        # Extraction reads the upload directly; nothing is stored
+        payload = handler.extract(file.read(), key)
+        message = PayloadProcessor.extract_payload(payload, key)
         
-        else:
-            return Response({"error": "Invalid operation"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"message": message.decode('utf-8')})
     
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+# Helper function to queue an embed
+def queue_embed(media_file, key_obj, message):
+    """Queue embed_task for a media file on its media type's queue and record the task."""
+    task = embed_task.apply_async(
+        args=[str(media_file.id), str(key_obj.id), message],
+        queue=queue_for(media_file.file_type)
+    )
+    media_file.task_id = task.id
+    media_file.save(update_fields=['task_id'])
+    return task
+
 # Helper function to get steganography handler
 def get_steganography_handler(file_type):
     """Get the appropriate steganography handler for the file type."""
-    if file_type == 'image':
-        return ImageSteganography()
-    elif file_type == 'audio':
-        return AudioSteganography()
-    elif file_type == 'video':
-        return VideoSteganography()
-    elif file_type in ['document', 'pdf', 'docx']:
-        return DocumentSteganography()
-    else:
+    try:
+        return _HANDLERS[file_type]
+    except KeyError:
         raise ValueError(f"Unsupported file type: {file_type}")
 
+# Helper function to stream a file as a download
+def file_download_response(file_obj, filename):
+    """Build an attachment response that streams in 1 MiB blocks."""
+    response = FileResponse(file_obj, as_attachment=True, filename=filename)
+    # FileResponse defaults to 4 KiB reads; larger blocks mean fewer syscalls
+    response.block_size = DOWNLOAD_BLOCK_SIZE
+    # Content-Length is already set by FileResponse from the file size
+    return response
+
+# Helper function to name a watermarked download
+def watermarked_download_name(media_file):
+    """Get the download name of a watermarked file, e.g. watermarked_photo.png."""
+    # The watermarked file's format (e.g. PNG for any image) can differ
+    # from the original's, so its extension comes from the stored file
+    stem = os.path.splitext(media_file.file_name)[0]
+    ext = os.path.splitext(media_file.watermarked_file.name)[1]
+    return f"watermarked_{stem}{ext}"
+
 # File download endpoint
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def download_file(request, pk):
-    """Download a processed file."""
+    """Download the watermarked version of a file."""
     try:
         media_file = MediaFile.objects.get(id=pk, user=request.user)
     except MediaFile.DoesNotExist:
         return Response({"error": "File not found"}, status=status.HTTP_404_NOT_FOUND)
     
-    if not media_file.processed_file:
+    if not media_file.watermarked_file:
         return Response({"error": "No processed file available"}, status=status.HTTP_400_BAD_REQUEST)
     
     try:
-        response = FileResponse(media_file.processed_file.open('rb'), 
-                               as_attachment=True, 
-                               filename=f"processed_{media_file.name}")
-        return response
+        return file_download_response(media_file.watermarked_file.open('rb'), 
+                                      watermarked_download_name(media_file))
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -239,42 +255,65 @@ class UserViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class CryptoKeyViewSet(viewsets.ModelViewSet):
+class CachedListMixin:
+    """Cache serialized list responses per user, invalidated on writes."""
+    list_cache_prefix = None
+    
+    def list(self, request, *args, **kwargs):
+        origin = f"{request.scheme}://{request.get_host()}"
+        cache_key = list_cache_key(self.list_cache_prefix, request.user.id, origin,
+                                   request.query_params.urlencode())
+        data = cache.get(cache_key)
+        if data is None:
+            data = self.get_list_data(request, *args, **kwargs)
+            cache.set(cache_key, data, LIST_CACHE_TIMEOUT)
+        return Response(data)
+    
+    def get_list_data(self, request, *args, **kwargs):
+        """Build the uncached list payload."""
+        return super().list(request, *args, **kwargs).data
+
+
+class CryptoKeyViewSet(CachedListMixin, viewsets.ModelViewSet):
     """API endpoint for cryptographic key management."""
     serializer_class = CryptoKeySerializer
     permission_classes = [permissions.IsAuthenticated]
+    list_cache_prefix = 'keys'
     
     def get_queryset(self):
-        return CryptoKey.objects.filter(user=self.request.user)
+        return CryptoKey.objects.filter(user=self.request.user).order_by('-created_at')
+    
+    def get_list_data(self, request, *args, **kwargs):
+        """Serialize the key list with serpy; writes keep the DRF serializer."""
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(CryptoKeyListSerializer(page, many=True).data).data
+        return CryptoKeyListSerializer(queryset, many=True).data
     
     def perform_create(self, serializer):
-        key_type = serializer.validated_data.get('key_type')
-        key_instance = serializer.save(user=self.request.user)
+        key_instance = serializer.save(user=self.request.user, status='pending')
         
-        # Generate and save the actual key
-        if key_type == 'session':
-            key = KeyManager.generate_session_key()
-            with open(key_instance.key_path(), 'wb') as f:
-                f.write(key)
-        elif key_type in ['exchange', 'signing']:
-            if key_type == 'exchange':
-                private_key, public_key = KeyManager.generate_keypair()
-            else:  # signing
-                private_key, public_key = KeyManager.generate_signing_keypair()
-                
-            with open(key_instance.key_path(), 'wb') as f:
-                f.write(private_key)
-            with open(key_instance.public_key_path(), 'wb') as f:
-                f.write(public_key)
+        # Generate the actual key material on a worker, publishing only once
+        # the row is committed so the worker can never miss it
+        transaction.on_commit(lambda: self._dispatch_key_generation(key_instance))
+    
+    def _dispatch_key_generation(self, key_instance):
+        """Queue key generation, or mark the key failed if the broker is unreachable."""
+        try:
+            generate_key_task.delay(str(key_instance.id))
+        except Exception:
+            logger.exception(f"Could not queue key generation for key {key_instance.id}")
+            key_instance.status = 'failed'
+            key_instance.save(update_fields=['status'])
     
     @action(detail=True, methods=['get'])
     def download(self, request, pk=None):
         """Download the key file."""
         key = self.get_object()
         try:
-            with open(key.key_path(), 'rb') as f:
-                response = FileResponse(f, as_attachment=True, filename=f"{key.name}.key")
-                return response
+            # The file on disk is encrypted; hand out the plain key
+            return file_download_response(io.BytesIO(KeyManager.get_key(key.id)), f"{key.name}.key")
         except FileNotFoundError:
             return Response({"error": "Key file not found"}, status=status.HTTP_404_NOT_FOUND)
     
@@ -287,37 +326,66 @@ class CryptoKeyViewSet(viewsets.ModelViewSet):
                            status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            with open(key.public_key_path(), 'rb') as f:
-                response = FileResponse(f, as_attachment=True, filename=f"{key.name}.pub")
-                return response
+            return file_download_response(open(key.public_key_path(), 'rb'), f"{key.name}.pub")
         except FileNotFoundError:
             return Response({"error": "Public key file not found"}, status=status.HTTP_404_NOT_FOUND)
 
 
-class MediaFileViewSet(viewsets.ModelViewSet):
+class MediaFileViewSet(CachedListMixin, viewsets.ModelViewSet):
     """API endpoint for media file management and steganography operations."""
     serializer_class = MediaFileSerializer
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser]
+    list_cache_prefix = 'files'
     
     def get_queryset(self):
-        return MediaFile.objects.filter(user=self.request.user)
+        # Join the key up front; MediaFileSerializer nests it on every row
+        return (MediaFile.objects.filter(user=self.request.user)
+                .select_related('key', 'user')
+                .order_by('-created_at'))
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
     
+    def get_list_data(self, request, *args, **kwargs):
+        """Build the file list from a values() projection, skipping model instances."""
+        queryset = self.filter_queryset(self.get_queryset()).values(*MEDIA_FILE_LIST_VALUES)
+        page = self.paginate_queryset(queryset)
+        rows = [self._list_row(row) for row in (queryset if page is None else page)]
+        if page is not None:
+            return self.get_paginated_response(rows).data
+        return rows
+    
+    def _list_row(self, row):
+        """Shape a values() row like MediaFileSerializer output, minus the message."""
+        key = None
+        if row['key__id'] is not None:
+            key = {
+                'id': str(row['key__id']),
+                'name': row['key__name'],
+                'key_type': row['key__key_type'],
+                'status': row['key__status'],
+                'created_at': list_datetime_field.to_representation(row['key__created_at'])
+            }
+        return {
+            'id': str(row['id']),
+            'file_name': row['file_name'],
+            'file_type': row['file_type'],
+            'original_file': self._file_url(row['original_file']),
+            'watermarked_file': self._file_url(row['watermarked_file']),
+            'key': key,
+            'created_at': list_datetime_field.to_representation(row['created_at'])
+        }
+    
+    def _file_url(self, name):
+        """Get the absolute URL of a stored file, as DRF's FileField renders it."""
+        if not name:
+            return None
+        return self.request.build_absolute_uri(default_storage.url(name))
+    
     def get_steganography_handler(self, file_type):
         """Get the appropriate steganography handler for the file type."""
-        if file_type == 'image':
-            return ImageSteganography()
-        elif file_type == 'audio':
-            return AudioSteganography()
-        elif file_type == 'video':
-            return VideoSteganography()
-        elif file_type in ['document', 'pdf', 'docx']:
-            return DocumentSteganography()
-        else:
-            raise ValueError(f"Unsupported file type: {file_type}")
+        return get_steganography_handler(file_type)
     
     @action(detail=True, methods=['post'])
     def embed(self, request, pk=None):
@@ -345,48 +413,34 @@ class MediaFileViewSet(viewsets.ModelViewSet):
             return Response({"error": "Key not found"}, 
                            status=status.HTTP_404_NOT_FOUND)
         
-        try:
-            # Read the key
-            with open(key_obj.key_path(), 'rb') as f:
-                key = f.read()
-            
-            # Read the original file
-            with media_file.original_file.open('rb') as f:
-                original_data = f.read()
-            
-            # Process the payload
-            payload, _ = PayloadProcessor.prepare_payload(message.encode('utf-8'), key)
-            
-            # Get the appropriate handler
-            handler = self.get_steganography_handler(media_file.file_type)
-            
-            # Embed the payload
-            with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                output_data = handler.embed(original_data, payload, key)
-                temp_file.write(output_data)
-                temp_file_path = temp_file.name
-            
-            # Save the watermarked file
-            filename = os.path.basename(media_file.original_file.name)
-            with open(temp_file_path, 'rb') as f:
-                media_file.watermarked_file.save(f"watermarked_{filename}", f)
-            
-            # Clean up
-            os.unlink(temp_file_path)
-            
-            # Update the media file record
-            media_file.message = message
-            media_file.key = key_obj
-            media_file.save()
-            
-            return Response({
-                "success": True,
-                "media_file": MediaFileSerializer(media_file).data
-            })
-            
-        except Exception as e:
-            return Response({"error": str(e)}, 
-                           status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if key_obj.status != 'ready':
+            return Response({"error": "Key is not ready yet"}, 
+                           status=status.HTTP_409_CONFLICT)
+        
+        # Hand the embedding off to a worker and return immediately
+        task = queue_embed(media_file, key_obj, message)
+        
+        return Response({"task_id": task.id}, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=True, methods=['get'], url_path='status')
+    def task_status(self, request, pk=None):
+        """Get the state of the embedding task for the media file."""
+        media_file = self.get_object()
+        if not media_file.task_id:
+            return Response({"error": "No embedding task for this file"}, 
+                           status=status.HTTP_404_NOT_FOUND)
+        
+        result = AsyncResult(media_file.task_id)
+        data = {
+            "task_id": media_file.task_id,
+            "state": result.state
+        }
+        if result.successful():
+            data["media_file"] = MediaFileSerializer(media_file).data
+        elif result.failed():
+            data["error"] = str(result.result)
+        
+        return Response(data)
     
     @action(detail=True, methods=['post'])
     def extract(self, request, pk=None):
@@ -404,8 +458,7 @@ class MediaFileViewSet(viewsets.ModelViewSet):
         
         try:
             # Read the key
-            with open(media_file.key.key_path(), 'rb') as f:
-                key = f.read()
+            key = KeyManager.get_key(media_file.key_id)
             
             # Read the watermarked file
             with media_file.watermarked_file.open('rb') as f:
@@ -437,8 +490,8 @@ class MediaFileViewSet(viewsets.ModelViewSet):
             return Response({"error": "No original file available"}, 
                            status=status.HTTP_404_NOT_FOUND)
         
-        return FileResponse(media_file.original_file, as_attachment=True, 
-                           filename=media_file.file_name)
+        return file_download_response(media_file.original_file.open('rb'), 
+                                      media_file.file_name)
     
     @action(detail=True, methods=['get'])
     def download_watermarked(self, request, pk=None):
@@ -448,5 +501,5 @@ class MediaFileViewSet(viewsets.ModelViewSet):
             return Response({"error": "No watermarked file available"}, 
                            status=status.HTTP_404_NOT_FOUND)
         
-        return FileResponse(media_file.watermarked_file, as_attachment=True, 
-                           filename=f"watermarked_{media_file.file_name}")
+        return file_download_response(media_file.watermarked_file.open('rb'), 
+                                      watermarked_download_name(media_file))
@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'stegano_web.settings')
 
 application = get_asgi_application()
+
+from stegano_api.startup import prepare_process  # noqa: E402
+
+prepare_process()
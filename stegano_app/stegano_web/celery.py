@@ -0,0 +1,25 @@
+"""
+Celery application for stegano_web project.
+
+Embedding runs on worker processes rather than in the request thread.
+Audio and video jobs go to the ``heavy`` queue, everything else to ``light``,
+so CPU-bound workers can be scaled independently.
+"""
+
+import os
+
+from celery import Celery
+from celery.signals import worker_process_init
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'stegano_web.settings')
+
+app = Celery('stegano_web')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
+
+
+@worker_process_init.connect
+def prepare_worker_process(**kwargs):
+    """Run the serving-process start-up in every worker process."""
+    from stegano_api.startup import prepare_process
+    prepare_process()
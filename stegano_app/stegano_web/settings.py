@@ -126,3 +126,39 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 # Key storage directory
 KEY_STORAGE_DIR = os.path.join(BASE_DIR, 'keys')
 os.makedirs(KEY_STORAGE_DIR, exist_ok=True)
+
+# Fernet master key protecting key files at rest (urlsafe base64, 32 bytes).
+# There is deliberately no fallback: a key derived from anything in this file
+# would let anyone with the source decrypt the key files. Generate one with
+# python -c "from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())"
+# Only processes that use keys need it: the WSGI/ASGI apps and Celery workers
+# refuse to start without it (stegano_api.startup), management commands don't.
+KEY_MASTER_KEY = os.environ.get('STEGANO_KEY_MASTER_KEY')
+
+# Celery settings
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', CELERY_BROKER_URL)
+CELERY_TASK_DEFAULT_QUEUE = 'light'
+CELERY_TASK_TRACK_STARTED = True
+
+# Cache for list responses. They are cached per user and invalidated by
+# post_save/post_delete signals, which also fire in Celery workers (task
+# status updates), so the cache must be shared by every web and Celery
+# process: set CACHE_URL (e.g. redis://localhost:6379/1, needs the redis
+# package). Without it each process gets a local memory cache, which is only
+# correct when one process serves requests and runs the tasks.
+CACHE_URL = os.environ.get('CACHE_URL')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+            'KEY_PREFIX': 'stegano',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
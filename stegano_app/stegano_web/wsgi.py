@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'stegano_web.settings')
 
 application = get_wsgi_application()
+
+from stegano_api.startup import prepare_process  # noqa: E402
+
+prepare_process()
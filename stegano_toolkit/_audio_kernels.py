@@ -0,0 +1,66 @@
+"""
+Compiled QIM kernels for the audio steganography module.
+
+Numba is optional: when it is not installed the same kernels run as
+vectorized NumPy expressions.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+
+def _qim_embed_numpy(proj, bits, step):
+    """Get the shift that moves each projection onto the lattice of its bit."""
+    shift = np.zeros_like(proj)
+    n_bits = len(bits)
+    dither = bits * (step / 2)
+    shift[:n_bits] = step * np.round((proj[:n_bits] - dither) / step) + dither - proj[:n_bits]
+    return shift
+
+
+def _qim_extract_numpy(proj, step):
+    """Decode one bit per projection by picking the closer shifted lattice."""
+    err0 = np.abs(proj - step * np.round(proj / step))
+    shifted = proj - step / 2
+    err1 = np.abs(shifted - step * np.round(shifted / step))
+    return (err1 < err0).astype(np.uint8)
+
+
+if HAVE_NUMBA:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def qim_embed(proj, bits, step):
+        """Get the shift that moves each projection onto the lattice of its bit."""
+        shift = np.zeros_like(proj)
+        half = step / 2
+        for i in prange(bits.shape[0]):
+            dither = bits[i] * half
+            shift[i] = step * np.round((proj[i] - dither) / step) + dither - proj[i]
+        return shift
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def qim_extract(proj, step):
+        """Decode one bit per projection by picking the closer shifted lattice."""
+        bits = np.empty(proj.shape[0], dtype=np.uint8)
+        half = step / 2
+        for i in prange(proj.shape[0]):
+            err0 = abs(proj[i] - step * np.round(proj[i] / step))
+            shifted = proj[i] - half
+            err1 = abs(shifted - step * np.round(shifted / step))
+            bits[i] = 1 if err1 < err0 else 0
+        return bits
+else:
+    qim_embed = _qim_embed_numpy
+    qim_extract = _qim_extract_numpy
+
+
+def warm_up():
+    """Compile the kernels ahead of the first real request."""
+    proj = np.zeros(4, dtype=np.float64)
+    bits = np.zeros(4, dtype=np.uint8)
+    qim_embed(proj, bits, 1.0)
+    qim_extract(proj, 1.0)
@@ -0,0 +1,39 @@
+"""
+File output helpers shared by the CLI and the web app.
+"""
+
+import os
+import tempfile
+from contextlib import contextmanager
+
+# Mode of new outputs. mkstemp creates files as 0600; reading the umask to
+# mimic open() would mean briefly changing it for the whole process
+NEW_FILE_MODE = 0o644
+
+
+@contextmanager
+def atomic_output(path, buffering=-1):
+    """
+    Open a binary file for writing that only appears at path once complete.
+
+    Data goes to a temporary file in the same directory, which replaces path
+    when the block exits normally. On any exception it is removed instead, so
+    a failed embed never leaves a truncated file at the final path. A
+    replaced file keeps its permissions; a new one gets NEW_FILE_MODE.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(path)}.", suffix='.tmp'
+    )
+    try:
+        with os.fdopen(fd, 'wb', buffering) as f:
+            yield f
+        try:
+            mode = os.stat(path).st_mode & 0o7777
+        except FileNotFoundError:
+            mode = NEW_FILE_MODE
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
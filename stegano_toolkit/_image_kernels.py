@@ -0,0 +1,187 @@
+"""
+Compiled Haar DWT and QIM kernels for the image steganography module.
+
+The Haar transform is the unnormalized integer one: each level sums and
+differences the four samples of a 2x2 block without the orthonormal 1/2,
+so 8-bit pixels stay exact in int16 (|coefficient| <= 4080 after two
+levels) and level-2 coefficients are 4x their orthonormal values.
+
+Numba is optional: when it is not installed the same kernels run as
+vectorized NumPy expressions.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+
+def _haar2_numpy(x):
+    """
+    One level of the integer 2-D Haar transform of an even-sized int16 array.
+    
+    Works on the four samples of every 2x2 block through strided views and
+    returns LL, LH, HL, HH.
+    """
+    a = x[0::2, 0::2]
+    b = x[0::2, 1::2]
+    c = x[1::2, 0::2]
+    d = x[1::2, 1::2]
+    
+    top_sum = a + b
+    bottom_sum = c + d
+    top_diff = a - b
+    bottom_diff = c - d
+    
+    # The sums/differences are reused as output buffers once consumed
+    ll = top_sum + bottom_sum
+    lh = np.subtract(top_sum, bottom_sum, out=top_sum)
+    hl = top_diff + bottom_diff
+    hh = np.subtract(top_diff, bottom_diff, out=top_diff)
+    return ll, lh, hl, hh
+
+
+def _ihaar2_numpy(ll, lh, hl, hh):
+    """Invert haar2, rounding each 2x2 block of the int16 output to nearest."""
+    top = ll + lh
+    bottom = ll - lh
+    left = hl + hh
+    right = hl - hh
+    
+    x = np.empty((ll.shape[0] * 2, ll.shape[1] * 2), dtype=np.int16)
+    np.add(top, left, out=x[0::2, 0::2])
+    np.subtract(top, left, out=x[0::2, 1::2])
+    np.add(bottom, right, out=x[1::2, 0::2])
+    np.subtract(bottom, right, out=x[1::2, 1::2])
+    # Exact for unmodified coefficients; QIM-shifted ones round half up
+    x += 2
+    x >>= 2
+    return x
+
+
+def _ihaar2_clip_numpy(ll, lh, hl, hh, out):
+    """Invert haar2 straight into a uint8 array, saturating and cropping to its shape."""
+    x = _ihaar2_numpy(ll, lh, hl, hh)[:out.shape[0], :out.shape[1]]
+    np.clip(x, 0, 255, out=x)
+    out[...] = x
+
+
+def _qim_embed_numpy(flat, bits, delta):
+    """Snap the leading coefficients onto the lattice of their bit, in place."""
+    n_bits = len(bits)
+    shift = bits * (delta / 2)
+    flat[:n_bits] = delta * np.round((flat[:n_bits] - shift) / delta) + shift
+
+
+def _qim_extract_numpy(flat, delta):
+    """Decode one bit per coefficient from the parity of the nearest half step."""
+    return (np.rint(flat / (delta / 2)).astype(np.int64) & 1).astype(np.uint8)
+
+
+if HAVE_NUMBA:
+    # The transforms compute all four sub-bands of a 2x2 block in one pass,
+    # with rows split across threads and the GIL released
+    @njit(parallel=True, nogil=True, cache=True)
+    def haar2(x):
+        """
+        One level of the integer 2-D Haar transform of an even-sized int16 array.
+        
+        Returns LL, LH, HL, HH.
+        """
+        rows = x.shape[0] // 2
+        cols = x.shape[1] // 2
+        ll = np.empty((rows, cols), dtype=np.int16)
+        lh = np.empty((rows, cols), dtype=np.int16)
+        hl = np.empty((rows, cols), dtype=np.int16)
+        hh = np.empty((rows, cols), dtype=np.int16)
+        for i in prange(rows):
+            for j in range(cols):
+                a = x[2 * i, 2 * j]
+                b = x[2 * i, 2 * j + 1]
+                c = x[2 * i + 1, 2 * j]
+                d = x[2 * i + 1, 2 * j + 1]
+                ll[i, j] = (a + b) + (c + d)
+                lh[i, j] = (a + b) - (c + d)
+                hl[i, j] = (a - b) + (c - d)
+                hh[i, j] = (a - b) - (c - d)
+        return ll, lh, hl, hh
+
+    @njit(parallel=True, nogil=True, cache=True)
+    def ihaar2(ll, lh, hl, hh):
+        """Invert haar2, rounding each 2x2 block of the int16 output to nearest."""
+        rows, cols = ll.shape
+        x = np.empty((rows * 2, cols * 2), dtype=np.int16)
+        for i in prange(rows):
+            for j in range(cols):
+                top = ll[i, j] + lh[i, j]
+                bottom = ll[i, j] - lh[i, j]
+                left = hl[i, j] + hh[i, j]
+                right = hl[i, j] - hh[i, j]
+                x[2 * i, 2 * j] = (top + left + 2) >> 2
+                x[2 * i, 2 * j + 1] = (top - left + 2) >> 2
+                x[2 * i + 1, 2 * j] = (bottom + right + 2) >> 2
+                x[2 * i + 1, 2 * j + 1] = (bottom - right + 2) >> 2
+        return x
+
+    @njit(inline='always')
+    def _store_u8(out, row, col, total):
+        """Round total / 4 and store it saturated, if (row, col) lies inside out."""
+        if row < out.shape[0] and col < out.shape[1]:
+            out[row, col] = min(max((total + 2) >> 2, 0), 255)
+
+    @njit(parallel=True, nogil=True, cache=True)
+    def ihaar2_clip(ll, lh, hl, hh, out):
+        """Invert haar2 straight into a uint8 array, saturating and cropping to its shape."""
+        rows, cols = ll.shape
+        for i in prange(rows):
+            for j in range(cols):
+                top = ll[i, j] + lh[i, j]
+                bottom = ll[i, j] - lh[i, j]
+                left = hl[i, j] + hh[i, j]
+                right = hl[i, j] - hh[i, j]
+                _store_u8(out, 2 * i, 2 * j, top + left)
+                _store_u8(out, 2 * i, 2 * j + 1, top - left)
+                _store_u8(out, 2 * i + 1, 2 * j, bottom + right)
+                _store_u8(out, 2 * i + 1, 2 * j + 1, bottom - right)
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def qim_embed(flat, bits, delta):
+        """Snap the leading coefficients onto the lattice of their bit, in place."""
+        half = delta / 2
+        for i in prange(bits.shape[0]):
+            shift = bits[i] * half
+            flat[i] = delta * np.rint((flat[i] - shift) / delta) + shift
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def qim_extract(flat, delta):
+        """Decode one bit per coefficient from the parity of the nearest half step."""
+        bits = np.empty(flat.shape[0], dtype=np.uint8)
+        half = delta / 2
+        for i in prange(flat.shape[0]):
+            bits[i] = np.int64(np.rint(flat[i] / half)) & 1
+        return bits
+else:
+    haar2 = _haar2_numpy
+    ihaar2 = _ihaar2_numpy
+    ihaar2_clip = _ihaar2_clip_numpy
+    qim_embed = _qim_embed_numpy
+    qim_extract = _qim_extract_numpy
+
+
+def warm_up():
+    """Compile the kernels ahead of the first real request."""
+    flat = np.zeros(4, dtype=np.float64)
+    bits = np.zeros(4, dtype=np.uint8)
+    qim_embed(flat, bits, 20.0)
+    qim_extract(flat, 20.0)
+    
+    # Contiguous bands, and the cropped (non-contiguous) level-1 LL that
+    # odd-sized images pass to the inverse
+    bands = haar2(np.zeros((4, 4), dtype=np.int16))
+    ihaar2(*bands)
+    ihaar2(bands[0][:1, :1], *(band[:1, :1] for band in bands[1:]))
+    # The clipping inverse writes into the Y plane of an HxWx3 image
+    ihaar2_clip(*bands, np.zeros((4, 4, 3), dtype=np.uint8)[..., 0])
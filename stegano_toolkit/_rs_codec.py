@@ -0,0 +1,117 @@
+"""
+Reed-Solomon codec for payload error correction.
+
+The byte-oriented codec comes from ``creedsolo`` when the C extension is
+installed and from pure-Python ``reedsolo`` otherwise. When the optional
+``galois`` package is installed, larger payloads are encoded and decoded
+block-wise with its vectorized GF(2^8) arithmetic instead. Both produce the
+same RS(255, 255 - nsym) codewords (primitive polynomial 0x11d, generator 2,
+first consecutive root 0), so data written by one decodes with the other.
+"""
+
+import threading
+
+import numpy as np
+
+try:
+    import creedsolo as _reedsolo
+except ImportError:
+    import reedsolo as _reedsolo
+
+try:
+    import galois
+    HAVE_GALOIS = True
+except ImportError:
+    HAVE_GALOIS = False
+
+ReedSolomonError = _reedsolo.ReedSolomonError
+
+BLOCK_SIZE = 255  # Codeword length in bytes
+# Payloads shorter than this many full blocks stay on the byte codec, where
+# the per-call overhead of the vectorized path does not pay off
+GALOIS_MIN_BLOCKS = 16
+
+
+class RSCodec:
+    """Systematic Reed-Solomon codec with nsym parity bytes per 255-byte block."""
+
+    def __init__(self, nsym):
+        self.nsym = nsym
+        self.k = BLOCK_SIZE - nsym
+        self._codec = _reedsolo.RSCodec(nsym)
+        self._galois = None
+        # galois' JIT-compiled kernels are not safe to enter from several
+        # threads at once, so calls on the vectorized path are serialized
+        self._galois_lock = threading.Lock()
+
+    def _galois_codec(self):
+        """Build the galois codec on first use; its construction JIT-compiles."""
+        if self._galois is None:
+            self._galois = galois.ReedSolomon(BLOCK_SIZE, self.k, c=0)
+        return self._galois
+
+    def _use_galois(self, length, block):
+        return HAVE_GALOIS and length >= GALOIS_MIN_BLOCKS * block
+
+    def encode(self, data):
+        """Append parity bytes to every k-byte block of data."""
+        if not self._use_galois(len(data), self.k):
+            return self._codec.encode(data)
+
+        message = np.frombuffer(data, dtype=np.uint8)
+        full = len(message) - len(message) % self.k
+
+        with self._galois_lock:
+            rs = self._galois_codec()
+            # Full blocks are encoded as one 2-D array; the tail is a shortened code
+            out = bytearray(np.asarray(
+                rs.encode(rs.field(message[:full].reshape(-1, self.k)))
+            ).tobytes())
+            if full < len(message):
+                out += np.asarray(rs.encode(rs.field(message[full:]))).tobytes()
+        return out
+
+    def decode(self, data):
+        """Correct errors in data and return the message bytes without parity."""
+        if not self._use_galois(len(data), BLOCK_SIZE):
+            return self._codec.decode(data)[0]
+
+        codewords = np.frombuffer(data, dtype=np.uint8)
+        full = len(codewords) - len(codewords) % BLOCK_SIZE
+        if full < len(codewords) and len(codewords) - full <= self.nsym:
+            raise ReedSolomonError("Trailing block is shorter than its parity")
+
+        with self._galois_lock:
+            rs = self._galois_codec()
+            message, n_errors = rs.decode(
+                rs.field(codewords[:full].reshape(-1, BLOCK_SIZE)), errors=True
+            )
+            out = bytearray(np.asarray(message).tobytes())
+            if (n_errors < 0).any():
+                raise ReedSolomonError("Too many errors to correct in a Reed-Solomon block")
+
+            if full < len(codewords):
+                tail, tail_errors = rs.decode(rs.field(codewords[full:]), errors=True)
+                if tail_errors < 0:
+                    raise ReedSolomonError("Too many errors to correct in a Reed-Solomon block")
+                out += np.asarray(tail).tobytes()
+        return out
+
+
+_warmed_up = False
+
+
+def warm_up(nsym=32):
+    """
+    Compile the galois kernels ahead of the first large payload, if installed.
+    
+    Must run on the main thread before the codec is used from worker
+    threads: a first, compiling call made from a worker thread leaves the
+    interpreter unable to exit.
+    """
+    global _warmed_up
+    if not HAVE_GALOIS or _warmed_up:
+        return
+    codec = RSCodec(nsym)
+    codec.decode(codec.encode(bytes(GALOIS_MIN_BLOCKS * codec.k + 1)))
+    _warmed_up = True
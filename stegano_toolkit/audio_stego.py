@@ -1,67 +1,178 @@
 """
-Audio steganography module using MDCT frames + spread-spectrum + QIM.
+Audio steganography module using rFFT frames + spread-spectrum + QIM.
 """
 
 import numpy as np
 import io
+import hashlib
+from functools import lru_cache
 from typing import Dict, Any
 import logging
 from pydub import AudioSegment
+from pydub.utils import mediainfo_json
 import os
+from ._audio_kernels import qim_embed, qim_extract
+from .common_crypto import HEADER_SIZE, PayloadProcessor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Transform frame length in samples
+FRAME_LEN = 2048
+# Mid-band rfft bins carrying the payload, split into one group per bit
+BAND_START = 64
+BAND_END = 576
+BINS_PER_BIT = 32
+BITS_PER_FRAME = (BAND_END - BAND_START) // BINS_PER_BIT
+
+# Signed PCM sample type for each pydub sample width in bytes
+_SAMPLE_DTYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+@lru_cache(maxsize=64)
+def _pn_sequence(seed):
+    """Derive unit-norm spreading vectors, one per bit slot in a frame, from the seed."""
+    rng = np.random.default_rng(int.from_bytes(hashlib.sha256(seed).digest()[:8], 'big'))
+    pn = rng.standard_normal((BITS_PER_FRAME, BINS_PER_BIT))
+    pn /= np.linalg.norm(pn, axis=1, keepdims=True)
+    # Shared between calls through the cache, so guard against mutation
+    pn.flags.writeable = False
+    return pn
+
+def _sample_bits(stream):
+    """Get the bits per decoded sample for an ffprobe audio stream."""
+    bits = int(stream.get('bits_per_sample') or 0)
+    if bits:
+        return bits
+    # Compressed codecs report 0; pydub decodes them to 16-bit PCM unless
+    # the decoder's sample format is wider
+    sample_fmt = stream.get('sample_fmt', '')
+    return 32 if sample_fmt.startswith(('s32', 'flt')) else 16
+
 class AudioSteganography:
-    """Implements steganography for audio files using MDCT and spread-spectrum."""
+    """Implements steganography for audio files using rFFT frames and spread-spectrum QIM."""
     
     def __init__(self, strength=0.1):
         self.strength = strength
     
-    def embed(self, audio_data, payload, seed):
-        """Embed payload into audio using MDCT and spread-spectrum."""
+    def output_extension(self, input_name):
+        """Get the file extension of embed output; audio is always written as WAV."""
+        return '.wav'
+    
+    def _open_source(self, audio_data):
+        """Wrap in-memory audio bytes; paths and file objects are passed through."""
+        if isinstance(audio_data, (bytes, bytearray, memoryview)):
+            return io.BytesIO(audio_data)
+        return audio_data
+    
+    def _frame_spectra(self, signal):
+        """Split a mono signal into frames and transform all of them in one rfft call."""
+        n_frames = len(signal) // FRAME_LEN
+        # Non-overlapping rectangular frames: irfft restores them exactly, so
+        # coefficients written on embed are read back unchanged on extract
+        frames = signal[:n_frames * FRAME_LEN].reshape(n_frames, FRAME_LEN)
+        return np.fft.rfft(frames, axis=1)
+    
+    def _project_band(self, spectra, pn):
+        """Project each bit's group of mid-band bins onto its PN vector."""
+        band = spectra[:, BAND_START:BAND_END].real
+        band = band.reshape(spectra.shape[0], BITS_PER_FRAME, BINS_PER_BIT)
+        return np.einsum('fbk,bk->fb', band, pn).ravel()
+    
+    def _qim_step(self):
+        """Quantization step in rfft units for the configured strength."""
+        return self.strength * FRAME_LEN * 8
+    
+    def embed(self, audio_data, payload, seed, output_path=None):
+        """
+        Embed payload into audio using rFFT frames and spread-spectrum QIM.
+        
+        When output_path is given the WAV is written straight to it and the
+        path is returned; otherwise the WAV bytes are returned.
+        """
+        if output_path is not None:
+            with open(output_path, 'wb') as f:
+                self.embed_to(f, audio_data, payload, seed)
+            return output_path
+        
+        output = io.BytesIO()
+        self.embed_to(output, audio_data, payload, seed)
+        return output.getvalue()
+    
+    def embed_to(self, output, audio_data, payload, seed):
+        """Embed payload into audio and write the stego WAV to a binary file object."""
         try:
-            # Load audio
-            audio = AudioSegment.from_file(io.BytesIO(audio_data))
+            # Load audio (decoded straight from disk when given a path)
+            audio = AudioSegment.from_file(self._open_source(audio_data))
+            
+            # View the PCM as a numpy array, one column per channel. The single
+            # bytearray copy makes it writable and is handed back to pydub as-is.
+            pcm = bytearray(audio.raw_data)
+            samples = np.frombuffer(pcm, dtype=_SAMPLE_DTYPES[audio.sample_width])
+            channels = samples.reshape(-1, audio.channels)
+            
+            # Transform the first channel frame by frame
+            spectra = self._frame_spectra(channels[:, 0].astype(np.float64))
+            n_frames = spectra.shape[0]
             
-            # Convert to numpy array
-            samples = np.array(audio.get_array_of_samples())
+            payload_bits = np.unpackbits(np.frombuffer(payload, dtype=np.uint8))
+            n_bits = len(payload_bits)
+            if n_bits > n_frames * BITS_PER_FRAME:
+                raise ValueError(f"Payload too large. Max capacity: {n_frames * BITS_PER_FRAME} bits")
             
-            # Simplified embedding (placeholder for actual implementation)
-            # In a real implementation, this would:
-            # 1. Apply MDCT to frames
-            # 2. Use spread-spectrum with the seed
-            # 3. Apply QIM to embed the payload
+            # Spread each bit over its bins with the PN sequence and quantize
+            # the projection onto the lattice shifted by bit * step/2
+            pn = _pn_sequence(bytes(seed))
+            proj = self._project_band(spectra, pn)
+            shift = qim_embed(proj, payload_bits, self._qim_step())
+            spectra[:, BAND_START:BAND_END] += (shift.reshape(n_frames, BITS_PER_FRAME, 1) * pn).reshape(n_frames, -1)
             
-            # Save modified audio
-            modified_audio = audio._spawn(samples.tobytes())
-            output = io.BytesIO()
-            modified_audio.export(output, format=audio.format or 'wav')
+            # Back to the time domain, saturating to the sample type
+            signal = np.fft.irfft(spectra, n=FRAME_LEN, axis=1).ravel()
+            limits = np.iinfo(samples.dtype)
+            channels[:len(signal), 0] = np.clip(np.rint(signal), limits.min, limits.max)
             
-            return output.getvalue()
+            # Save modified audio as WAV so the embedded bits survive
+            audio._spawn(pcm).export(output, format='wav')
             
         except Exception as e:
             logger.error(f"Error embedding payload in audio: {str(e)}")
             raise
     
-    def extract(self, audio_data, seed, payload_size):
-        """Extract payload from steganographic audio."""
+    def extract(self, audio_data, seed, payload_size=None):
+        """
+        Extract payload from steganographic audio.
+        
+        Without a payload_size the payload header is decoded first and the
+        size it records is used.
+        """
         try:
             # Load audio
-            audio = AudioSegment.from_file(io.BytesIO(audio_data))
+            audio = AudioSegment.from_file(self._open_source(audio_data))
             
-            # Convert to numpy array
-            samples = np.array(audio.get_array_of_samples())
+            # Zero-copy view of the PCM, one column per channel
+            samples = np.frombuffer(audio.raw_data, dtype=_SAMPLE_DTYPES[audio.sample_width])
+            channels = samples.reshape(-1, audio.channels)
             
-            # Simplified extraction (placeholder for actual implementation)
-            # In a real implementation, this would:
-            # 1. Apply MDCT to frames
-            # 2. Use spread-spectrum with the seed
-            # 3. Extract the payload using QIM
+            # Transform the first channel and project onto the PN sequence
+            spectra = self._frame_spectra(channels[:, 0].astype(np.float64))
+            proj = self._project_band(spectra, _pn_sequence(bytes(seed)))
+            step = self._qim_step()
             
-            # Return dummy payload for demonstration
-            return b"Extracted payload from audio"
+            if payload_size is None:
+                header_bits = qim_extract(np.ascontiguousarray(proj[:HEADER_SIZE * 8]), step)
+                payload_size = PayloadProcessor.embedded_size(np.packbits(header_bits).tobytes())
+                if payload_size * 8 > len(proj):
+                    raise ValueError(
+                        f"Header claims a {payload_size}-byte payload but the audio holds at most "
+                        f"{len(proj) // 8} bytes - not a stego file or the header is corrupted"
+                    )
+            
+            # Pick the closer of the two shifted lattices for every bit
+            n_bits = min(payload_size * 8, len(proj))
+            payload_bits = qim_extract(np.ascontiguousarray(proj[:n_bits]), step)
+            
+            return np.packbits(payload_bits).tobytes()
             
         except Exception as e:
             logger.error(f"Error extracting payload from audio: {str(e)}")
@@ -70,27 +181,31 @@ class AudioSteganography:
     def analyze_capacity(self, audio_data):
         """Analyze the capacity of an audio file for steganography."""
         try:
-            # Load audio
-            audio = AudioSegment.from_file(io.BytesIO(audio_data))
+            # Read stream parameters from the container header via ffprobe
+            # instead of decoding the whole file to PCM
+            info = mediainfo_json(self._open_source(audio_data))
+            stream = next(st for st in info['streams'] if st.get('codec_type') == 'audio')
             
             # Calculate capacity based on audio duration
-            duration_ms = len(audio)
-            sample_rate = audio.frame_rate
-            channels = audio.channels
+            duration = stream.get('duration') or info['format']['duration']
+            duration_ms = int(round(float(duration) * 1000))
+            sample_rate = int(stream['sample_rate'])
+            channels = int(stream['channels'])
+            sample_bits = _sample_bits(stream)
             
-            # Conservative estimate: 1 bit per 100 samples
-            capacity_bits = int((duration_ms * sample_rate * channels) / (1000 * 100))
+            # One frame of the first channel carries BITS_PER_FRAME bits
+            capacity_bits = (duration_ms * sample_rate // 1000 // FRAME_LEN) * BITS_PER_FRAME
             capacity_bytes = capacity_bits // 8
             
             return {
                 "duration_ms": duration_ms,
                 "sample_rate": sample_rate,
                 "channels": channels,
-                "format": audio.frame_width * 8,
+                "format": sample_bits * channels,
                 "capacity_bytes": capacity_bytes,
                 "recommended_max_payload": capacity_bytes // 2
             }
             
         except Exception as e:
             logger.error(f"Error analyzing audio capacity: {str(e)}")
-            raise
\ No newline at end of file
+            raise
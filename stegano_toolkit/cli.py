@@ -5,10 +5,14 @@ Command-line interface for the steganography toolkit.
 import argparse
 import sys
 import os
+import mmap
 import logging
-from typing import Dict, Any
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, Any, Optional
 
 from stegano_toolkit.common_crypto import KeyManager, PayloadProcessor
+from stegano_toolkit._fileio import atomic_output
 from stegano_toolkit.image_stego import ImageSteganography
 from stegano_toolkit.audio_stego import AudioSteganography
 from stegano_toolkit.video_stego import VideoSteganography
@@ -18,44 +22,112 @@ from stegano_toolkit.document_stego import DocumentSteganography
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# File type for each supported extension
+EXT_TO_TYPE = {
+    '.jpg': 'image', '.jpeg': 'image', '.png': 'image', '.bmp': 'image', '.tiff': 'image', '.webp': 'image',
+    '.mp3': 'audio', '.wav': 'audio', '.ogg': 'audio', '.flac': 'audio', '.aac': 'audio',
+    '.mp4': 'video', '.avi': 'video', '.mov': 'video', '.mkv': 'video', '.webm': 'video',
+    '.pdf': 'pdf',
+    '.docx': 'docx', '.doc': 'docx',
+}
+
+# Magic byte checks, as (offset, bytes) pairs, for files whose extension is
+# missing or unknown. Only the first 16 bytes of the file are read.
+MAGIC_SIGNATURES = (
+    (((0, b'%PDF'),), 'pdf'),
+    (((0, b'PK\x03\x04'),), 'docx'),
+    (((0, b'\x89PNG'),), 'image'),
+    (((0, b'\xff\xd8\xff'),), 'image'),
+    (((0, b'RIFF'), (8, b'WEBP')), 'image'),
+    (((0, b'RIFF'), (8, b'WAVE')), 'audio'),
+    (((0, b'ID3'),), 'audio'),
+    (((0, b'\xff\xfb'),), 'audio'),
+    (((0, b'OggS'),), 'audio'),
+    (((0, b'fLaC'),), 'audio'),
+    (((4, b'ftyp'),), 'video'),
+    (((0, b'RIFF'), (8, b'AVI ')), 'video'),
+    (((0, b'\x1a\x45\xdf\xa3'),), 'video'),
+)
+
+# File types whose extract() takes the payload size; None lets the handler
+# read it from the payload header
+SIZED_FILE_TYPES = ('audio', 'video')
+
+# Write buffer for embedded output files
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+# Handler class for each detected file type
+HANDLER_CLASSES = {
+    'image': ImageSteganography,
+    'audio': AudioSteganography,
+    'video': VideoSteganography,
+    'pdf': DocumentSteganography,
+    'docx': DocumentSteganography,
+}
+
+@contextmanager
+def open_input(file_path: str):
+    """
+    Map an input file read-only instead of reading it into memory.
+    
+    The mmap behaves like bytes for slicing and len() and like a file for
+    handlers that read/seek, so pages are only loaded when touched. Inputs
+    that cannot be mapped (empty files, pipes) are read normally.
+    """
+    with open(file_path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            yield f.read()
+            return
+        try:
+            yield mm
+        finally:
+            mm.close()
+
+@lru_cache(maxsize=8)
+def _load_key(file_path: str, mtime_ns: int) -> bytes:
+    """Read a key file; mtime_ns is part of the cache key so edits are picked up."""
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+def load_key(file_path: str) -> bytes:
+    """Read a key file, reusing the bytes while the file is unchanged."""
+    return _load_key(file_path, os.stat(file_path).st_mtime_ns)
+
+def _sniff_magic(file_path: str) -> Optional[str]:
+    """Detect the file type from its leading magic bytes, or None if unknown."""
+    with open(file_path, 'rb') as f:
+        head = f.read(16)
+    for checks, file_type in MAGIC_SIGNATURES:
+        if all(head.startswith(magic, offset) for offset, magic in checks):
+            return file_type
+    return None
+
 def detect_file_type(file_path: str) -> str:
-    """Detect the file type based on extension."""
-    _, ext = os.path.splitext(file_path)
-    ext = ext.lower()
+    """Detect the file type based on extension, falling back to magic bytes."""
+    # Only the text after the last dot matters for the lookup; a dot in a
+    # directory name just yields a key that misses and falls back to magic
+    _, dot, ext = file_path.rpartition('.')
+    ext = (dot + ext).lower()
     
-    if ext in ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp']:
-        return 'image'
-    elif ext in ['.mp3', '.wav', '.ogg', '.flac', '.aac']:
-        return 'audio'
-    elif ext in ['.mp4', '.avi', '.mov', '.mkv', '.webm']:
-        return 'video'
-    elif ext == '.pdf':
-        return 'pdf'
-    elif ext in ['.docx', '.doc']:
-        return 'docx'
-    else:
+    file_type = EXT_TO_TYPE.get(ext) or _sniff_magic(file_path)
+    if file_type is None:
         raise ValueError(f"Unsupported file type: {ext}")
+    return file_type
 
+@lru_cache(maxsize=None)
 def get_steganography_handler(file_type: str) -> Any:
-    """Get the appropriate steganography handler for the file type."""
-    if file_type == 'image':
-        return ImageSteganography()
-    elif file_type == 'audio':
-        return AudioSteganography()
-    elif file_type == 'video':
-        return VideoSteganography()
-    elif file_type in ['pdf', 'docx']:
-        return DocumentSteganography()
-    else:
+    """Get the steganography handler for the file type, built once and reused."""
+    try:
+        handler_class = HANDLER_CLASSES[file_type]
+    except KeyError:
         raise ValueError(f"Unsupported file type: {file_type}")
+    return handler_class()
 
 def embed_command(args: argparse.Namespace) -> None:
     """Handle the embed command."""
     try:
-        # Read the input file
-        with open(args.input_file, 'rb') as f:
-            input_data = f.read()
-        
         # Read the message
         if args.message_file:
             with open(args.message_file, 'rb') as f:
@@ -65,8 +137,7 @@ def embed_command(args: argparse.Namespace) -> None:
         
         # Generate or load keys
         if args.key_file:
-            with open(args.key_file, 'rb') as f:
-                key = f.read()
+            key = load_key(args.key_file)
         else:
             # Generate a new key
             key = KeyManager.generate_session_key()
@@ -83,12 +154,11 @@ def embed_command(args: argparse.Namespace) -> None:
         file_type = detect_file_type(args.input_file)
         handler = get_steganography_handler(file_type)
         
-        # Embed the payload
-        output_data = handler.embed(input_data, payload, key)
-        
-        # Write the output file
-        with open(args.output_file, 'wb') as f:
-            f.write(output_data)
+        # Embed the payload, letting the handler write the output file
+        # itself instead of holding the whole result in memory first
+        with open_input(args.input_file) as input_data, \
+             atomic_output(args.output_file, OUTPUT_BUFFER_SIZE) as output:
+            handler.embed_to(output, input_data, payload, key)
         
         logger.info(f"Payload embedded successfully in {args.output_file}")
         
@@ -99,20 +169,19 @@ def embed_command(args: argparse.Namespace) -> None:
 def extract_command(args: argparse.Namespace) -> None:
     """Handle the extract command."""
     try:
-        # Read the input file
-        with open(args.input_file, 'rb') as f:
-            input_data = f.read()
-        
         # Read the key
-        with open(args.key_file, 'rb') as f:
-            key = f.read()
+        key = load_key(args.key_file)
         
         # Detect file type and get appropriate handler
         file_type = detect_file_type(args.input_file)
         handler = get_steganography_handler(file_type)
         
         # Extract the payload
-        payload = handler.extract(input_data, key, args.payload_size)
+        with open_input(args.input_file) as input_data:
+            if file_type in SIZED_FILE_TYPES:
+                payload = handler.extract(input_data, key, args.payload_size)
+            else:
+                payload = handler.extract(input_data, key)
         
         # Process the payload
         message = PayloadProcessor.extract_payload(payload, key)
@@ -137,16 +206,20 @@ def extract_command(args: argparse.Namespace) -> None:
 def analyze_command(args: argparse.Namespace) -> None:
     """Handle the analyze command."""
     try:
-        # Read the input file
-        with open(args.input_file, 'rb') as f:
-            input_data = f.read()
-        
         # Detect file type and get appropriate handler
         file_type = detect_file_type(args.input_file)
         handler = get_steganography_handler(file_type)
         
-        # Analyze capacity
-        capacity_info = handler.analyze_capacity(input_data)
+        # Analyze capacity; handlers that only need the leading bytes and
+        # the size get just those instead of the whole file
+        if hasattr(handler, 'analyze_capacity_from_meta'):
+            with open(args.input_file, 'rb') as f:
+                header = f.read(16)
+                size = os.fstat(f.fileno()).st_size
+            capacity_info = handler.analyze_capacity_from_meta(header, size)
+        else:
+            with open_input(args.input_file) as input_data:
+                capacity_info = handler.analyze_capacity(input_data)
         
         # Print capacity information
         print(f"File: {args.input_file}")
@@ -207,7 +280,8 @@ def main() -> None:
     extract_parser.add_argument('input_file', help='Input file path')
     extract_parser.add_argument('--output-file', help='Output file path for the extracted message')
     extract_parser.add_argument('--key-file', required=True, help='File containing the encryption key')
-    extract_parser.add_argument('--payload-size', type=int, default=1024, help='Expected payload size in bytes')
+    extract_parser.add_argument('--payload-size', type=int,
+                                help='Embedded payload size in bytes (default: read from the payload header)')
     
     # Analyze command
     analyze_parser = subparsers.add_parser('analyze', help='Analyze a file for steganography capacity')
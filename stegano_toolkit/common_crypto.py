@@ -6,23 +6,208 @@ and HKDF-SHA256 for key derivation.
 
 import os
 import gzip
-from typing import Tuple, Optional, Dict, Any, Union, ByteString
+import hmac
+import logging
+import tempfile
+import threading
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Tuple, Optional, Dict, Any, Union, ByteString, Iterable, List
 
 from cryptography.hazmat.primitives.asymmetric import x25519, ed25519
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat, PrivateFormat, NoEncryption
-import reedsolo
+from cryptography.fernet import Fernet, InvalidToken
+
+from ._rs_codec import RSCodec, ReedSolomonError, warm_up as _warm_up_rs
+
+logger = logging.getLogger(__name__)
 
 # Constants
-HEADER_SIZE = 16  # Size of the steganography header in bytes
+HEADER_MAGIC = b'STG1'  # Marks the start of an embedded payload
+HEADER_VERSION = 2  # Version 2 Reed-Solomon encodes the header itself
+# magic | version | flags | AES-GCM nonce | original message length |
+# length of the Reed-Solomon encoded body that follows the header
+HEADER_FORMAT = '<4sBB12sII'
+HEADER_FIELDS_SIZE = struct.calcsize(HEADER_FORMAT)  # Size of the packed header fields
+FLAG_COMPRESSED = 0x01  # Header flag: payload body is gzip-compressed
+FLAG_SIGNED = 0x02  # Header flag: payload starts with an Ed25519 signature
+COMPRESS_SAMPLE_SIZE = 4096  # Bytes sampled to decide whether to compress
+INCOMPRESSIBLE_RATIO = 0.95  # Sample ratio above which gzip is skipped
 RS_REDUNDANCY = 32  # Reed-Solomon redundancy bytes
+# Size of the embedded header in bytes: the packed fields plus their own
+# Reed-Solomon parity, so a few flipped bits cannot corrupt the lengths
+HEADER_SIZE = HEADER_FIELDS_SIZE + RS_REDUNDANCY
+
+# Shared codec, so the Galois-field tables are built once per process
+_RS = RSCodec(RS_REDUNDANCY)
+
+
+# Ciphers kept by _aesgcm: enough for the keys a busy worker alternates
+# between, typically one or a few per active user
+AESGCM_CACHE_SIZE = 128
+
+
+def _aesgcm(key: ByteString) -> AESGCM:
+    """
+    Get an AES-GCM cipher for a session key, reusing the key schedule.
+    
+    Every session key passed to prepare_payload and extract_payload goes
+    through here: keyring entries in the web app, keys read from a file by
+    the CLI and ad-hoc per-session keys alike. The cache therefore holds up
+    to AESGCM_CACHE_SIZE of the most recently used keys in process memory
+    until they are evicted. A one-off key just pushes out the oldest entry,
+    which costs a key schedule rebuild the next time that key is used.
+    """
+    # The cache needs a hashable key; AESGCM itself also takes a bytearray
+    # or memoryview, so callers may still pass those
+    return _cached_aesgcm(bytes(key))
+
+
+@lru_cache(maxsize=AESGCM_CACHE_SIZE)
+def _cached_aesgcm(key: bytes) -> AESGCM:
+    return AESGCM(key)
+
+
+def _hkdf_sha256(ikm: bytes, salt: Optional[bytes], info: bytes, length: int = 32) -> bytes:
+    """
+    HKDF-SHA256 (RFC 5869) for outputs of at most one hash block.
+    
+    Same output as cryptography's HKDF, computed with two stdlib HMACs.
+    """
+    if length > 32:
+        raise ValueError("_hkdf_sha256 only supports outputs up to 32 bytes")
+    prk = hmac.new(salt or b'\x00' * 32, ikm, 'sha256').digest()
+    return hmac.new(prk, info + b'\x01', 'sha256').digest()[:length]
+
+
+@lru_cache(maxsize=64)
+def _derive_seed(key: bytes, salt: bytes) -> bytes:
+    """Cached seed derivation for KeyManager.derive_seed with a given salt."""
+    return _hkdf_sha256(key, salt, b'stego_seed')
 
 
 class KeyManager:
     """Manages cryptographic keys for steganography operations."""
     
+    # In-process keyring: key id -> decrypted key bytes. Key files on disk
+    # are Fernet-encrypted with a process-level master key. The directory is
+    # only decrypted on first use; None means not loaded yet.
+    _keyring: Optional[Dict[str, bytes]] = None
+    _keyring_dir: Optional[str] = None
+    _keyring_master_key: Optional[Union[str, bytes]] = None
+    _keyring_fernet: Optional[Fernet] = None
+    _keyring_lock = threading.Lock()
+    
+    @classmethod
+    def configure_keyring(cls, key_dir: str, master_key: Optional[Union[str, bytes]]) -> None:
+        """
+        Point the keyring at a key directory without reading it yet.
+        
+        The directory is decrypted on the first get_key or store_key, so a
+        process that never uses a key does not need the master key and does
+        not touch the key files.
+        """
+        with cls._keyring_lock:
+            cls._keyring_dir = key_dir
+            cls._keyring_master_key = master_key
+            cls._keyring_fernet = None
+            cls._keyring = None
+    
+    @classmethod
+    def load_keyring(cls, key_dir: str, master_key: Union[str, bytes]) -> None:
+        """Configure the keyring and decrypt its directory right away."""
+        cls.configure_keyring(key_dir, master_key)
+        cls._loaded_keyring()
+    
+    @classmethod
+    def _loaded_keyring(cls) -> Dict[str, bytes]:
+        """
+        Get the keyring, decrypting every key file in its directory on first use.
+        
+        Files that cannot be read or decrypted are logged and skipped, so one
+        bad file does not make every key unavailable; get_key raises for
+        them when they are actually used.
+        """
+        keyring = cls._keyring
+        if keyring is not None:
+            return keyring
+        
+        with cls._keyring_lock:
+            if cls._keyring is None:
+                if cls._keyring_dir is None or not cls._keyring_master_key:
+                    raise RuntimeError("Keyring not configured - call KeyManager.configure_keyring "
+                                       "with a key directory and master key first")
+                cls._keyring_fernet = Fernet(cls._keyring_master_key)
+                keyring = {}
+                for filename in os.listdir(cls._keyring_dir):
+                    key_id, ext = os.path.splitext(filename)
+                    if ext != '.key':
+                        continue
+                    try:
+                        keyring[key_id] = cls._read_key_file(os.path.join(cls._keyring_dir, filename))
+                    except (OSError, ValueError) as e:
+                        logger.error(f"Skipping key file {filename}: {str(e)}")
+                cls._keyring = keyring
+            return cls._keyring
+    
+    @classmethod
+    def _read_key_file(cls, path: str) -> bytes:
+        """Read and decrypt a key file, encrypting legacy plaintext files in place."""
+        with open(path, 'rb') as f:
+            data = f.read()
+        
+        # Key files written before encryption at rest hold the raw key
+        if not data.startswith(b'gAAAAA'):
+            try:
+                cls._write_key_file(path, data)
+            except OSError as e:
+                logger.warning(f"Could not encrypt legacy key file {path}: {str(e)}")
+            return data
+        
+        try:
+            return cls._keyring_fernet.decrypt(data)
+        except InvalidToken:
+            raise ValueError(f"Cannot decrypt key file {path} - wrong master key?")
+    
+    @classmethod
+    def _write_key_file(cls, path: str, key: bytes) -> None:
+        """Encrypt a key to a file, replacing it atomically so it is never left half-written."""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(cls._keyring_fernet.encrypt(key))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    
+    @classmethod
+    def _key_file_path(cls, key_id: str) -> str:
+        return os.path.join(cls._keyring_dir, f"{key_id}.key")
+    
+    @classmethod
+    def store_key(cls, key_id: Any, key: bytes) -> None:
+        """Encrypt a key to its key file and add it to the keyring."""
+        key_id = str(key_id)
+        keyring = cls._loaded_keyring()
+        cls._write_key_file(cls._key_file_path(key_id), key)
+        keyring[key_id] = key
+    
+    @classmethod
+    def get_key(cls, key_id: Any) -> bytes:
+        """Get a key from the keyring, loading it from disk if another process created it."""
+        key_id = str(key_id)
+        keyring = cls._loaded_keyring()
+        try:
+            return keyring[key_id]
+        except KeyError:
+            key = cls._read_key_file(cls._key_file_path(key_id))
+            keyring[key_id] = key
+            return key
+    
     @staticmethod
     def generate_keypair() -> Tuple[bytes, bytes]:
         """Generate an X25519 key pair for key exchange."""
@@ -80,12 +265,7 @@ class KeyManager:
         shared_key = ephemeral_private.exchange(public_key)
         
         # Derive an encryption key from the shared secret
-        derived_key = HKDF(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=None,
-            info=b'session_key_wrap'
-        ).derive(shared_key)
+        derived_key = _hkdf_sha256(shared_key, None, b'session_key_wrap')
         
         # Encrypt the session key
         aesgcm = AESGCM(derived_key)
@@ -116,12 +296,7 @@ class KeyManager:
         shared_key = private.exchange(ephemeral_public)
         
         # Derive the encryption key
-        derived_key = HKDF(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=None,
-            info=b'session_key_wrap'
-        ).derive(shared_key)
+        derived_key = _hkdf_sha256(shared_key, None, b'session_key_wrap')
         
         # Decrypt the session key
         aesgcm = AESGCM(derived_key)
@@ -150,16 +325,10 @@ class KeyManager:
     def derive_seed(key: bytes, salt: bytes = None) -> bytes:
         """Derive a seed for CSPRNG from a key and optional salt."""
         if salt is None:
-            salt = os.urandom(16)
-            
-        derived_key = HKDF(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            info=b'stego_seed'
-        ).derive(key)
-        
-        return derived_key
+            # A fresh random salt never repeats, so there is nothing to cache
+            return _hkdf_sha256(key, os.urandom(16), b'stego_seed')
+        
+        return _derive_seed(bytes(key), bytes(salt))
 
 
 class PayloadProcessor:
@@ -173,52 +342,133 @@ class PayloadProcessor:
     ) -> Tuple[bytes, Dict[str, Any]]:
         """
         Prepare a payload for embedding:
-        1. Compress with gzip
+        1. Compress with gzip (skipped for incompressible data)
         2. Encrypt with AES-256-GCM
         3. Add error correction with Reed-Solomon
-        4. Add a header with metadata
+        4. Add a Reed-Solomon protected header with metadata
         
         Returns the prepared payload and metadata dictionary.
         """
-        # Compress the message
-        compressed = gzip.compress(message)
+        # Sample the head of the message at the fastest level; already
+        # compressed inputs (zip, PDF streams, JPEG) barely shrink, so they
+        # are stored raw instead of paying for a full deflate pass
+        sample = message[:COMPRESS_SAMPLE_SIZE]
+        ratio = len(zlib.compress(sample, 1)) / max(len(sample), 1)
+        should_compress = ratio <= INCOMPRESSIBLE_RATIO
+        
+        flags = 0
+        if should_compress:
+            # Compress the message to gzip format in one zlib stream; wbits=31
+            # makes zlib emit the gzip header and CRC trailer itself, so no
+            # header + body + trailer concatenation is needed. Level 1 is
+            # several times faster than 9 for a few percent of size
+            compressor = zlib.compressobj(1, zlib.DEFLATED, 31)
+            compressed = compressor.compress(message) + compressor.flush()
+            flags |= FLAG_COMPRESSED
+        else:
+            compressed = message
         
         # Generate a random nonce for AES-GCM
         nonce = os.urandom(12)
         
         # Encrypt the compressed message
-        aesgcm = AESGCM(session_key)
+        aesgcm = _aesgcm(session_key)
         encrypted = aesgcm.encrypt(nonce, compressed, None)
         
         # Optionally sign the encrypted data
         signature = None
         if signing_key is not None:
             signature = KeyManager.sign_data(encrypted, signing_key)
+            flags |= FLAG_SIGNED
             
         # Prepare the payload with metadata
         metadata = {
             "version": 1,
             "nonce": nonce,
+            "compressed": should_compress,
             "has_signature": signature is not None
         }
         
-        # Combine encrypted data and signature if present
+        # Combine encrypted data and signature if present, copying each
+        # part once into a buffer of the final size
         payload = encrypted
         if signature is not None:
-            payload = signature + encrypted
+            payload = bytearray(len(signature) + len(encrypted))
+            payload[:len(signature)] = signature
+            payload[len(signature):] = encrypted
             
         # Apply Reed-Solomon error correction
-        rs = reedsolo.RSCodec(RS_REDUNDANCY)
-        encoded_payload = rs.encode(payload)
+        encoded_payload = _RS.encode(payload)
         
-        # Create a header with metadata
-        header = os.urandom(HEADER_SIZE)  # Placeholder for a real header
+        # Create a header with metadata, protected by its own parity bytes
+        header = _RS.encode(struct.pack(
+            HEADER_FORMAT, HEADER_MAGIC, HEADER_VERSION, flags, nonce,
+            len(message), len(encoded_payload)
+        ))
         
-        # Combine header and encoded payload
-        final_payload = header + encoded_payload
+        # Combine header and encoded payload in a single allocation
+        final_payload = b''.join((header, encoded_payload))
         
         return final_payload, metadata
     
+    @staticmethod
+    def prepare_payloads(
+        messages: Iterable[bytes],
+        session_key: bytes,
+        signing_key: bytes = None,
+        max_workers: int = None
+    ) -> List[Tuple[bytes, Dict[str, Any]]]:
+        """
+        Prepare several payloads concurrently, in the order given.
+        
+        zlib and AES-GCM release the GIL on large buffers, so one message can
+        be compressed or encrypted while another is being Reed-Solomon
+        encoded. A single message takes the plain prepare_payload path.
+        """
+        messages = list(messages)
+        if len(messages) <= 1:
+            return [
+                PayloadProcessor.prepare_payload(message, session_key, signing_key)
+                for message in messages
+            ]
+        
+        # Compile the vectorized RS kernels here rather than in a worker thread
+        _warm_up_rs(RS_REDUNDANCY)
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(
+                lambda message: PayloadProcessor.prepare_payload(message, session_key, signing_key),
+                messages
+            ))
+    
+    @staticmethod
+    def _parse_header(embedded_data: bytes) -> Tuple[int, bytes, int, int]:
+        """Correct and validate the payload header and return its flags, nonce and lengths."""
+        if len(embedded_data) < HEADER_SIZE:
+            raise ValueError("Embedded data is too short to contain a header")
+        try:
+            fields = _RS.decode(bytes(embedded_data[:HEADER_SIZE]))
+        except ReedSolomonError:
+            raise ValueError("Too many errors in the payload header to recover it")
+        magic, version, flags, nonce, message_length, encoded_length = struct.unpack(
+            HEADER_FORMAT, fields
+        )
+        if magic != HEADER_MAGIC:
+            raise ValueError("No steganography header found in the embedded data")
+        if version != HEADER_VERSION:
+            raise ValueError(f"Unsupported payload version: {version}")
+        return flags, nonce, message_length, encoded_length
+    
+    @staticmethod
+    def embedded_size(header: bytes) -> int:
+        """
+        Get the total size in bytes of an embedded payload from its header.
+        
+        Lets carriers that need a length up front read the HEADER_SIZE bytes
+        first and then exactly the rest of the payload.
+        """
+        return HEADER_SIZE + PayloadProcessor._parse_header(header)[3]
+    
     @staticmethod
     def extract_payload(
         embedded_data: bytes, 
@@ -227,52 +477,56 @@ class PayloadProcessor:
     ) -> bytes:
         """
         Extract and process an embedded payload:
-        1. Remove the header
+        1. Correct, parse and validate the header
         2. Apply Reed-Solomon error correction
         3. Verify signature if a verification key is provided
         4. Decrypt with AES-256-GCM
-        5. Decompress with gzip
+        5. Decompress with gzip if the header flags say so
         
         Returns the original message.
         """
-        # Extract header and payload
-        header = embedded_data[:HEADER_SIZE]
-        encoded_payload = embedded_data[HEADER_SIZE:]
+        # Extract header and payload; anything read past the encoded body
+        # (e.g. a carrier extracted with a generous size) is ignored
+        flags, nonce, message_length, encoded_length = PayloadProcessor._parse_header(embedded_data)
+        encoded_payload = embedded_data[HEADER_SIZE:HEADER_SIZE + encoded_length]
         
         # Apply Reed-Solomon error correction
-        rs = reedsolo.RSCodec(RS_REDUNDANCY)
         try:
-            payload = rs.decode(encoded_payload)[0]
-        except reedsolo.ReedSolomonError:
+            payload = _RS.decode(encoded_payload)
+        except ReedSolomonError:
             raise ValueError("Too many errors in the embedded data to recover the payload")
         
-        # Extract signature if present (simplified - in a real implementation, 
-        # this would be determined from the header)
+        # Extract signature if the header says one is present
         signature = None
         encrypted = payload
-        if verify_key is not None:
-            # Assuming signature is 64 bytes for Ed25519
+        if flags & FLAG_SIGNED:
+            # Ed25519 signatures are 64 bytes
             signature = payload[:64]
             encrypted = payload[64:]
-            
+        
+        if verify_key is not None:
             # Verify the signature
-            if not KeyManager.verify_signature(encrypted, signature, verify_key):
+            if signature is None or not KeyManager.verify_signature(encrypted, signature, verify_key):
                 raise ValueError("Signature verification failed")
         
-        # Extract nonce (simplified - in a real implementation, this would be in the header)
-        nonce = header[:12]  # Using part of the header as nonce for demonstration
-        
         # Decrypt the payload
-        aesgcm = AESGCM(session_key)
+        aesgcm = _aesgcm(session_key)
         try:
             compressed = aesgcm.decrypt(nonce, encrypted, None)
         except Exception:
             raise ValueError("Decryption failed - incorrect key or corrupted data")
         
-        # Decompress the message
-        try:
-            message = gzip.decompress(compressed)
-        except Exception:
-            raise ValueError("Decompression failed - data may be corrupted")
+        # Payloads flagged as incompressible were stored raw
+        if not flags & FLAG_COMPRESSED:
+            message = compressed
+        else:
+            # Decompress the message
+            try:
+                message = gzip.decompress(compressed)
+            except Exception:
+                raise ValueError("Decompression failed - data may be corrupted")
+        
+        if len(message) != message_length:
+            raise ValueError("Extracted message length does not match the header")
         
         return message
\ No newline at end of file
@@ -3,26 +3,185 @@ Document steganography module for PDF and DOCX files.
 """
 
 import io
+import re
+import base64
 import logging
+import zipfile
+import xml.etree.ElementTree as ET
 from typing import Dict, Any
 import pikepdf
-from docx import Document
-import tempfile
 import os
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# DOCX core properties part; the payload lives in its dc:description
+# element, which Word shows as the document "Comments"
+DOCX_CORE_PART = 'docProps/core.xml'
+_CORE_NAMESPACES = {
+    'cp': 'http://schemas.openxmlformats.org/package/2006/metadata/core-properties',
+    'dc': 'http://purl.org/dc/elements/1.1/',
+    'dcterms': 'http://purl.org/dc/terms/',
+    'dcmitype': 'http://purl.org/dc/dcmitype/',
+    'xsi': 'http://www.w3.org/2001/XMLSchema-instance',
+}
+_DC_DESCRIPTION = '{http://purl.org/dc/elements/1.1/}description'
+_CP_CORE_PROPERTIES = '{%s}coreProperties' % _CORE_NAMESPACES['cp']
+# Package entries that register a newly added core properties part
+DOCX_CONTENT_TYPES_PART = '[Content_Types].xml'
+DOCX_RELS_PART = '_rels/.rels'
+_CORE_CONTENT_TYPE_OVERRIDE = (
+    b'<Override PartName="/docProps/core.xml" '
+    b'ContentType="application/vnd.openxmlformats-package.core-properties+xml"/>'
+)
+_CORE_RELATIONSHIP = (
+    b'<Relationship Id="rIdStegoCoreProps" '
+    b'Type="http://schemas.openxmlformats.org/package/2006/relationships/metadata/core-properties" '
+    b'Target="docProps/core.xml"/>'
+)
+# Prefix of base64-encoded DOCX payloads; unprefixed values are legacy hex
+DOCX_B64_PREFIX = 'b64:'
+
+# PDF trailer entries used by the incremental-update fast path
+PDF_TAIL_SIZE = 1024  # startxref must sit within this many bytes of EOF
+_PDF_STARTXREF = re.compile(rb'startxref\s+(\d+)')
+_PDF_SIZE = re.compile(rb'/Size\s+(\d+)')
+_PDF_REF_ENTRY = rb'/%s\s+(\d+)\s+(\d+)\s+R'
+_PDF_ID = re.compile(rb'/ID\s*\[[^\]]*\]')
+_PDF_LENGTH = re.compile(rb'/Length\s+(\d+)')
+
+# Keep the conventional prefixes when core.xml is serialized again
+for _prefix, _uri in _CORE_NAMESPACES.items():
+    ET.register_namespace(_prefix, _uri)
+
 class DocumentSteganography:
     """Implements steganography for document files (PDF and DOCX)."""
     
     def __init__(self):
         pass
     
+    def output_extension(self, input_name):
+        """Get the file extension of embed output; documents keep their format."""
+        return os.path.splitext(input_name)[1].lower()
+    
     def embed_pdf(self, pdf_data, payload, seed):
         """Embed payload into PDF using object stream."""
+        output = io.BytesIO()
+        self.embed_pdf_to(output, pdf_data, payload, seed)
+        return output.getvalue()
+    
+    def _pdf_last_trailer(self, pdf_data):
+        """
+        Locate the last classic xref section and its trailer dictionary.
+        
+        Returns (xref_offset, trailer_bytes), or None when the file ends with
+        a cross-reference stream or cannot be read this way.
+        """
+        tail_start = max(len(pdf_data) - PDF_TAIL_SIZE, 0)
+        tail = bytes(pdf_data[tail_start:])
+        matches = list(_PDF_STARTXREF.finditer(tail))
+        if not matches:
+            return None
+        xref_offset = int(matches[-1].group(1))
+        if pdf_data[xref_offset:xref_offset + 4] != b'xref':
+            return None
+        
+        trailer_start = pdf_data.find(b'trailer', xref_offset)
+        trailer_end = pdf_data.find(b'startxref', trailer_start)
+        if trailer_start < 0 or trailer_end < 0:
+            return None
+        return xref_offset, bytes(pdf_data[trailer_start:trailer_end])
+    
+    def _embed_pdf_incremental(self, output, pdf_data, payload):
+        """
+        Append the payload as a PDF incremental update.
+        
+        Writes the original bytes unchanged, then a new stream object, a
+        one-entry xref section and a trailer that points /Stego at the
+        stream, so the cost is independent of the document's size. Returns
+        False without writing anything when the fast path does not apply.
+        """
+        located = self._pdf_last_trailer(pdf_data)
+        if located is None:
+            return False
+        prev_offset, trailer = located
+        
+        size = _PDF_SIZE.search(trailer)
+        root = re.search(_PDF_REF_ENTRY % b'Root', trailer)
+        if size is None or root is None or b'/Encrypt' in trailer:
+            # Encrypted documents would need the stream encrypted too
+            return False
+        
+        # Carry over the entries a reader expects in the newest trailer
+        entries = [b'/Size %d' % (int(size.group(1)) + 1), root.group(0)]
+        info = re.search(_PDF_REF_ENTRY % b'Info', trailer)
+        if info is not None:
+            entries.append(info.group(0))
+        file_id = _PDF_ID.search(trailer)
+        if file_id is not None:
+            entries.append(file_id.group(0))
+        
+        obj_num = int(size.group(1))
+        separator = b'' if pdf_data[-1:] == b'\n' else b'\n'
+        obj_offset = len(pdf_data) + len(separator)
+        obj = b''.join((
+            b'%d 0 obj\n<< /Length %d >>\nstream\n' % (obj_num, len(payload)),
+            payload,
+            b'\nendstream\nendobj\n',
+        ))
+        xref = b'xref\n%d 1\n%010d 00000 n \n' % (obj_num, obj_offset)
+        entries.append(b'/Prev %d' % prev_offset)
+        entries.append(b'/Stego %d 0 R' % obj_num)
+        new_trailer = b'trailer\n<< %s >>\nstartxref\n%d\n%%%%EOF\n' % (
+            b' '.join(entries), obj_offset + len(obj)
+        )
+        
+        output.write(pdf_data)
+        output.write(b''.join((separator, obj, xref, new_trailer)))
+        return True
+    
+    def _extract_pdf_incremental(self, pdf_data):
+        """Read a payload appended by _embed_pdf_incremental, or None if absent."""
+        located = self._pdf_last_trailer(pdf_data)
+        if located is None:
+            return None
+        xref_offset, trailer = located
+        stego = re.search(_PDF_REF_ENTRY % b'Stego', trailer)
+        if stego is None:
+            return None
+        obj_num = int(stego.group(1))
+        
+        # Find the object's offset in the newest xref section
+        lines = bytes(pdf_data[xref_offset:xref_offset + len(b'xref') + 64]).split()
+        if len(lines) < 5 or lines[1:3] != [b'%d' % obj_num, b'1']:
+            return None
+        obj_offset = int(lines[3])
+        
+        obj_header = b'%d 0 obj' % obj_num
+        header_end = pdf_data.find(b'stream', obj_offset)
+        if header_end < 0 or pdf_data[obj_offset:obj_offset + len(obj_header)] != obj_header:
+            return None
+        length = _PDF_LENGTH.search(bytes(pdf_data[obj_offset:header_end]))
+        if length is None:
+            return None
+        
+        # Stream data starts after the EOL that follows the keyword
+        data_start = header_end + len(b'stream')
+        if pdf_data[data_start:data_start + 2] == b'\r\n':
+            data_start += 2
+        else:
+            data_start += 1
+        return bytes(pdf_data[data_start:data_start + int(length.group(1))])
+    
+    def embed_pdf_to(self, output, pdf_data, payload, seed):
+        """Embed payload into PDF, writing the result to a binary file object."""
         try:
+            # Append an incremental update when the file allows it, rather
+            # than parsing and rewriting the whole document
+            if self._embed_pdf_incremental(output, pdf_data, payload):
+                return
+            
             # Open the PDF
             with pikepdf.Pdf.open(io.BytesIO(pdf_data)) as pdf:
                 # Create a custom metadata object to store the payload
@@ -31,11 +190,8 @@ class DocumentSteganography:
                 pdf.Root.Stego = pikepdf.Stream(pdf, payload)
                 
                 # Save the modified PDF
-                output = io.BytesIO()
                 pdf.save(output)
                 
-                return output.getvalue()
-                
         except Exception as e:
             logger.error(f"Error embedding payload in PDF: {str(e)}")
             raise
@@ -43,10 +199,17 @@ class DocumentSteganography:
     def extract_pdf(self, pdf_data, seed):
         """Extract payload from PDF."""
         try:
+            payload = self._extract_pdf_incremental(pdf_data)
+            if payload is not None:
+                return payload
+            
             # Open the PDF
             with pikepdf.Pdf.open(io.BytesIO(pdf_data)) as pdf:
-                # Extract the payload from the custom metadata
-                if hasattr(pdf.Root, 'Stego'):
+                # Extract the payload from the update trailer or, for files
+                # written by the full rewrite, the custom catalog entry
+                if '/Stego' in pdf.trailer:
+                    return bytes(pdf.trailer.Stego.read_bytes())
+                elif hasattr(pdf.Root, 'Stego'):
                     return bytes(pdf.Root.Stego.read_bytes())
                 else:
                     raise ValueError("No steganographic payload found in PDF")
@@ -55,39 +218,50 @@ class DocumentSteganography:
             logger.error(f"Error extracting payload from PDF: {str(e)}")
             raise
     
+    def _set_core_comments(self, core_xml, text):
+        """Return core.xml with its dc:description set to text."""
+        if core_xml is None:
+            root = ET.Element(_CP_CORE_PROPERTIES)
+        else:
+            root = ET.fromstring(core_xml)
+        description = root.find(_DC_DESCRIPTION)
+        if description is None:
+            description = ET.SubElement(root, _DC_DESCRIPTION)
+        description.text = text
+        return ET.tostring(root, encoding='UTF-8', xml_declaration=True)
+    
     def embed_docx(self, docx_data, payload, seed):
-        """Embed payload into DOCX using customXml."""
+        """Embed payload into DOCX by patching the core properties part."""
+        output = io.BytesIO()
+        self.embed_docx_to(output, docx_data, payload, seed)
+        return output.getvalue()
+    
+    def embed_docx_to(self, output, docx_data, payload, seed):
+        """Embed payload into DOCX, writing the result to a binary file object."""
         try:
-            # Create temporary files
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as input_file, \
-                 tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as output_file:
-                
-                # Write input DOCX data
-                input_file.write(docx_data)
-                input_file.flush()
+            # base64 grows the payload by a third, where hex doubled it
+            comments = DOCX_B64_PREFIX + base64.b64encode(payload).decode('ascii')
+            
+            # A DOCX is a ZIP container: copy every part across in memory and
+            # rewrite only core.xml, without loading the document body
+            with zipfile.ZipFile(io.BytesIO(docx_data)) as src:
+                has_core = DOCX_CORE_PART in src.namelist()
                 
-                # Open the document
-                doc = Document(input_file.name)
-                
-                # Add a custom property to store the payload
-                # In a real implementation, this would use proper steganography
-                # techniques like hiding in customXml parts
-                core_props = doc.core_properties
-                core_props.comments = payload.hex()
-                
-                # Save the modified document
-                doc.save(output_file.name)
-                
-                # Read the output file
-                output_file.close()
-                with open(output_file.name, 'rb') as f:
-                    result = f.read()
-                
-                # Clean up temporary files
-                os.unlink(input_file.name)
-                os.unlink(output_file.name)
-                
-                return result
+                with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as dst:
+                    for info in src.infolist():
+                        data = src.read(info.filename)
+                        if info.filename == DOCX_CORE_PART:
+                            data = self._set_core_comments(data, comments)
+                        elif not has_core and info.filename == DOCX_CONTENT_TYPES_PART:
+                            data = data.replace(b'</Types>', _CORE_CONTENT_TYPE_OVERRIDE + b'</Types>')
+                        elif not has_core and info.filename == DOCX_RELS_PART:
+                            data = data.replace(b'</Relationships>', _CORE_RELATIONSHIP + b'</Relationships>')
+                        dst.writestr(info, data)
+                    
+                    # No core properties part yet: add one and register it
+                    # in the content types and package relationships above
+                    if not has_core:
+                        dst.writestr(DOCX_CORE_PART, self._set_core_comments(None, comments))
                 
         except Exception as e:
             logger.error(f"Error embedding payload in DOCX: {str(e)}")
@@ -96,28 +270,25 @@ class DocumentSteganography:
     def extract_docx(self, docx_data, seed):
         """Extract payload from DOCX."""
         try:
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as input_file:
-                
-                # Write input DOCX data
-                input_file.write(docx_data)
-                input_file.flush()
-                
-                # Open the document
-                doc = Document(input_file.name)
-                
-                # Extract the payload from the custom property
-                core_props = doc.core_properties
-                if core_props.comments:
-                    payload = bytes.fromhex(core_props.comments)
-                else:
-                    raise ValueError("No steganographic payload found in DOCX")
-                
-                # Clean up temporary file
-                input_file.close()
-                os.unlink(input_file.name)
-                
-                return payload
+            # Only the core properties part is needed, read straight from the ZIP
+            with zipfile.ZipFile(io.BytesIO(docx_data)) as src:
+                try:
+                    core_xml = src.read(DOCX_CORE_PART)
+                except KeyError:
+                    core_xml = None
+            
+            comments = None
+            if core_xml is not None:
+                comments = ET.fromstring(core_xml).findtext(_DC_DESCRIPTION)
+            
+            if comments and comments.startswith(DOCX_B64_PREFIX):
+                payload = base64.b64decode(comments[len(DOCX_B64_PREFIX):])
+            elif comments:
+                payload = bytes.fromhex(comments)
+            else:
+                raise ValueError("No steganographic payload found in DOCX")
+            
+            return payload
                 
         except Exception as e:
             logger.error(f"Error extracting payload from DOCX: {str(e)}")
@@ -125,10 +296,20 @@ class DocumentSteganography:
     
     def embed(self, document_data, payload, seed, document_type=None):
         """Embed payload into document (auto-detect type if not specified)."""
+        output = io.BytesIO()
+        self.embed_to(output, document_data, payload, seed, document_type)
+        return output.getvalue()
+    
+    def embed_to(self, output, document_data, payload, seed, document_type=None):
+        """Embed payload into document, writing the result to a binary file object."""
+        if isinstance(document_data, (str, os.PathLike)):
+            with open(document_data, 'rb') as f:
+                document_data = f.read()
+        
         if document_type == 'pdf' or (document_type is None and document_data[:4] == b'%PDF'):
-            return self.embed_pdf(document_data, payload, seed)
+            self.embed_pdf_to(output, document_data, payload, seed)
         elif document_type == 'docx' or (document_type is None and document_data[:2] == b'PK'):
-            return self.embed_docx(document_data, payload, seed)
+            self.embed_docx_to(output, document_data, payload, seed)
         else:
             raise ValueError("Unsupported document type")
     
@@ -143,26 +324,38 @@ class DocumentSteganography:
     
     def analyze_capacity(self, document_data, document_type=None):
         """Analyze the capacity of a document for steganography."""
+        return self.analyze_capacity_from_meta(
+            document_data[:16], len(document_data), document_type
+        )
+    
+    def analyze_capacity_from_meta(self, header, size, document_type=None):
+        """
+        Analyze capacity from the leading bytes and total size of a document.
+        
+        The estimate only depends on the type and size, so callers holding
+        a path can pass the first 16 bytes and the file size instead of the
+        whole document.
+        """
         try:
             # Determine document type
-            if document_type == 'pdf' or (document_type is None and document_data[:4] == b'%PDF'):
+            if document_type == 'pdf' or (document_type is None and header[:4] == b'%PDF'):
                 # For PDF, estimate based on file size
-                capacity_bytes = len(document_data) // 100  # Conservative estimate
+                capacity_bytes = size // 100  # Conservative estimate
                 
                 return {
                     "type": "pdf",
-                    "size_bytes": len(document_data),
+                    "size_bytes": size,
                     "capacity_bytes": capacity_bytes,
                     "recommended_max_payload": capacity_bytes // 2
                 }
                 
-            elif document_type == 'docx' or (document_type is None and document_data[:2] == b'PK'):
+            elif document_type == 'docx' or (document_type is None and header[:2] == b'PK'):
                 # For DOCX, estimate based on file size
-                capacity_bytes = len(document_data) // 200  # More conservative for DOCX
+                capacity_bytes = size // 200  # More conservative for DOCX
                 
                 return {
                     "type": "docx",
-                    "size_bytes": len(document_data),
+                    "size_bytes": size,
                     "capacity_bytes": capacity_bytes,
                     "recommended_max_payload": capacity_bytes // 2
                 }
@@ -176,4 +369,4 @@ class DocumentSteganography:
             return {
                 "capacity_bytes": 1000,  # Conservative default
                 "recommended_max_payload": 500
-            }
\ No newline at end of file
+            }
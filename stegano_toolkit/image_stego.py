@@ -4,169 +4,218 @@ Image steganography module using 2-level DWT on the Y channel and QIM.
 
 import numpy as np
 import io
+import os
+import mmap
 import logging
 import cv2
-import pywt
 from PIL import Image
-from .common_crypto import PayloadProcessor
+from .common_crypto import HEADER_SIZE, PayloadProcessor
+from ._image_kernels import haar2, ihaar2, ihaar2_clip, qim_embed, qim_extract
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# zlib level for the stego PNG. Level 3 encodes in roughly half the time of
+# the default level 6 at a slightly larger file; the DWT-modified pixels
+# compress poorly at any level, so the higher levels buy little.
+PNG_COMPRESSION_LEVEL = 3
+
+def _haar2(x):
+    """
+    One level of the integer 2-D Haar transform.
+    
+    Returns int16 (LL, (LH, HL, HH)) with pywt.dwt2's layout and signs, each
+    twice the orthonormal coefficient. Odd sizes repeat the last row/column,
+    as pywt's periodization mode does for Haar.
+    """
+    x = np.asarray(x, dtype=np.int16)
+    if x.shape[0] % 2 or x.shape[1] % 2:
+        x = np.pad(x, ((0, x.shape[0] % 2), (0, x.shape[1] % 2)), mode='edge')
+    ll, lh, hl, hh = haar2(x)
+    return ll, (lh, hl, hh)
+
+
+def _ihaar2(ll, details):
+    """Invert _haar2."""
+    return ihaar2(ll, *details)
+
+
 class ImageSteganography:
     """
     Image steganography class using 2-level DWT on the Y channel and QIM.
     """
     
-    def __init__(self):
-        """Initialize the image steganography object."""
-        self.payload_processor = PayloadProcessor()
-        
+    def output_extension(self, input_name):
+        """Get the file extension of embed output; stego images are always PNG."""
+        return '.png'
+    
     def _convert_to_ycbcr(self, img):
-        """Convert RGB image to YCbCr color space."""
-        if isinstance(img, np.ndarray):
-            return cv2.cvtColor(img, cv2.COLOR_RGB2YCrCb)
-        else:
-            return img.convert('YCbCr')
+        """
+        Convert an RGB image to a YCrCb array with OpenCV.
+        
+        PIL images are viewed as an RGB array first, so both inputs go
+        through the same conversion. Channel order is Y, Cr, Cb.
+        """
+        if not isinstance(img, np.ndarray):
+            img = np.asarray(img.convert('RGB'))
+        return cv2.cvtColor(img, cv2.COLOR_RGB2YCrCb)
     
-    def _convert_to_rgb(self, img):
-        """Convert YCbCr image to RGB color space."""
-        if isinstance(img, np.ndarray):
-            return cv2.cvtColor(img, cv2.COLOR_YCrCb2RGB)
-        else:
-            return img.convert('RGB')
+    def _decode_to_ycbcr(self, image_data):
+        """
+        Decode an image straight to a YCrCb array with OpenCV.
+        
+        Accepts bytes-like data (including an mmap), a path or a file-like
+        object. The decoded BGR array is the only image-sized allocation
+        besides the returned YCrCb array.
+        """
+        if isinstance(image_data, (str, os.PathLike)):
+            with open(image_data, 'rb') as f:
+                image_data = f.read()
+        elif not isinstance(image_data, (bytes, bytearray, memoryview, mmap.mmap)):
+            image_data = image_data.read()
+        
+        bgr = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if bgr is None:
+            raise ValueError("Could not decode image data")
+        return cv2.cvtColor(bgr, cv2.COLOR_BGR2YCrCb)
+    
+    def _encode_png(self, ycc):
+        """Convert a YCrCb array to BGR in one pass and encode it as PNG."""
+        ok, buf = cv2.imencode(
+            '.png', cv2.cvtColor(ycc, cv2.COLOR_YCrCb2BGR),
+            [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION_LEVEL]
+        )
+        if not ok:
+            raise ValueError("Could not encode stego image as PNG")
+        return buf
     
     def _apply_dwt(self, y_channel):
-        """Apply 2-level DWT to Y channel."""
-        coeffs = pywt.wavedec2(y_channel, 'haar', level=2)
-        return coeffs
+        """
+        Apply 2-level Haar DWT to Y channel.
+        
+        Returns [LL2, (LH2, HL2, HH2), (LH1, HL1, HH1)], the same layout as
+        pywt.wavedec2. The integer transform leaves level-2 coefficients at
+        4x their orthonormal values.
+        """
+        ll1, details1 = _haar2(y_channel)
+        ll2, details2 = _haar2(ll1)
+        return [ll2, details2, details1]
     
-    def _inverse_dwt(self, coeffs):
-        """Apply inverse 2-level DWT."""
-        return pywt.waverec2(coeffs, 'haar')
+    def _inverse_dwt(self, coeffs, out):
+        """
+        Apply inverse 2-level Haar DWT, writing the result into out.
+        
+        out is a uint8 plane (e.g. the Y channel of a YCrCb image); the last
+        level is clipped to 0..255 and cropped to out's shape as it is written.
+        """
+        ll2, details2, details1 = coeffs
+        ll1 = _ihaar2(ll2, details2)
+        # Odd-sized level-1 bands come back one row/column longer
+        rows, cols = details1[0].shape
+        ihaar2_clip(ll1[:rows, :cols], *details1, out)
     
-    def _embed_in_coeffs(self, coeffs, payload_bits, key):
+    def _usable_coeffs(self, coeffs, image_shape):
+        """
+        Get the level-2 horizontal detail coefficients that can carry bits.
+        
+        Only coefficients of complete 4x4 pixel blocks are used: on the last
+        row/column of an image whose size is not a multiple of 4, part of the
+        block is padding that the inverse DWT crops away, so bits embedded
+        there do not survive the round trip.
+        """
+        height, width = image_shape
+        return coeffs[1][1][:height // 4, :width // 4]
+    
+    def _embed_in_coeffs(self, coeffs, payload_bits, key, image_shape):
         """Embed payload bits in DWT coefficients using QIM."""
-        # Get the horizontal detail coefficients from level 2
-        h_coeffs = coeffs[1][1].copy()
+        # Get the usable horizontal detail coefficients from level 2; the
+        # sub-band belongs to this coeffs list, so it is modified in place
+        h_coeffs = self._usable_coeffs(coeffs, image_shape)
         
         # QIM parameters
-        delta = 20  # Quantization step
+        delta = 80  # Quantization step (20 on the orthonormal scale)
         
-        # Flatten coefficients for embedding
-        flat_coeffs = h_coeffs.flatten()
+        # Float copy of the coefficients for embedding
+        flat_coeffs = h_coeffs.astype(np.float64).ravel()
         
         # Ensure we have enough capacity
         if len(payload_bits) > len(flat_coeffs):
             raise ValueError(f"Payload too large. Max capacity: {len(flat_coeffs)} bits")
         
-        # Embed using QIM
-        for i in range(len(payload_bits)):
-            bit = payload_bits[i]
-            coeff = flat_coeffs[i]
-            
-            # QIM embedding
-            if bit == 0:
-                flat_coeffs[i] = delta * round(coeff / delta)
-            else:
-                flat_coeffs[i] = delta * round(coeff / delta + 0.5) - delta/2
-        
-        # Reshape back to original shape
-        h_coeffs = flat_coeffs.reshape(h_coeffs.shape)
+        # Embed using QIM: bit 0 snaps to multiples of delta, bit 1 to the
+        # lattice shifted by delta/2, i.e. delta*round((c - b*delta/2)/delta)
+        # + b*delta/2 with no branch on the bit
+        qim_embed(flat_coeffs, payload_bits, float(delta))
         
-        # Update coefficients
-        coeffs[1] = (coeffs[1][0], h_coeffs, coeffs[1][2])
+        # Write the coefficients back; the lattices only hold multiples of
+        # delta/2, so the cast back to int16 is exact
+        h_coeffs[...] = flat_coeffs.reshape(h_coeffs.shape)
         
         return coeffs
     
-    def _extract_from_coeffs(self, coeffs, payload_length, key):
-        """Extract payload bits from DWT coefficients using QIM."""
-        # Get the horizontal detail coefficients from level 2
-        h_coeffs = coeffs[1][1]
+    def _extract_from_coeffs(self, coeffs, start, count, key, image_shape):
+        """Extract count payload bits from DWT coefficients using QIM, starting at bit start."""
+        # Get the usable horizontal detail coefficients from level 2
+        h_coeffs = self._usable_coeffs(coeffs, image_shape)
         
         # QIM parameters
-        delta = 20  # Quantization step
-        
-        # Flatten coefficients for extraction
-        flat_coeffs = h_coeffs.flatten()
-        
-        # Extract bits
-        payload_bits = []
-        for i in range(payload_length):
-            if i >= len(flat_coeffs):
-                break
-                
-            coeff = flat_coeffs[i]
-            
-            # QIM extraction
-            q0 = delta * round(coeff / delta)
-            q1 = delta * round(coeff / delta + 0.5) - delta/2
-            
-            # Determine which quantizer is closer
-            if abs(coeff - q0) < abs(coeff - q1):
-                payload_bits.append(0)
-            else:
-                payload_bits.append(1)
+        delta = 80  # Quantization step (20 on the orthonormal scale)
         
-        return payload_bits
+        # Flat view (a copy for cropped bands); extraction only reads them
+        flat_coeffs = h_coeffs.ravel()
+        
+        # Extract bits, stopping at the end of the sub-band; the nearest
+        # multiple of delta/2 is even on the bit-0 lattice and odd on bit 1
+        coeff = flat_coeffs[start:start + count].astype(np.float64)
+        return qim_extract(coeff, float(delta))
     
     def embed(self, image_data, payload, key=None):
         """
         Embed payload in image using 2-level DWT and QIM.
         
         Args:
-            image_data: Image data as bytes or file-like object
-            payload: String payload to embed
+            image_data: Image data as bytes, file path or file-like object
+            payload: Prepared payload bytes to embed
             key: Optional encryption key
             
         Returns:
             Bytes of stego image in PNG format
         """
-        # Process payload
-        payload_bits = self.payload_processor.prepare_payload(payload, key)
-        
-        # Open image
-        if isinstance(image_data, bytes):
-            img = Image.open(io.BytesIO(image_data))
-        else:
-            img = Image.open(image_data)
-        
-        # Convert to YCbCr
-        ycbcr = self._convert_to_ycbcr(img)
+        return self._embed_png(image_data, payload, key).tobytes()
+    
+    def embed_to(self, output, image_data, payload, key=None):
+        """
+        Embed payload in image and write the stego PNG to a file object.
         
-        # Split channels
-        y, cb, cr = ycbcr.split()
+        Args:
+            output: Binary file-like object the PNG is written to
+            image_data: Image data as bytes, file path or file-like object
+            payload: Prepared payload bytes to embed
+            key: Optional encryption key
+        """
+        output.write(self._embed_png(image_data, payload, key))
+    
+    def _embed_png(self, image_data, payload, key=None):
+        """Embed payload in image and return the encoded PNG buffer."""
+        # Unpack the prepared payload to one bit per byte, MSB first
+        payload_bits = np.unpackbits(np.frombuffer(payload, dtype=np.uint8))
         
-        # Convert to numpy array
-        y_array = np.array(y)
+        # Decode to YCrCb and take the Y channel
+        ycc = self._decode_to_ycbcr(image_data)
+        y_array = ycc[..., 0]
         
         # Apply DWT
         coeffs = self._apply_dwt(y_array)
         
         # Embed payload
-        modified_coeffs = self._embed_in_coeffs(coeffs, payload_bits, key)
-        
-        # Apply inverse DWT
-        modified_y = self._inverse_dwt(modified_coeffs)
-        
-        # Ensure values are in valid range
-        modified_y = np.clip(modified_y, 0, 255).astype(np.uint8)
-        
-        # Create new Y channel image
-        modified_y_img = Image.fromarray(modified_y)
+        modified_coeffs = self._embed_in_coeffs(coeffs, payload_bits, key, y_array.shape)
         
-        # Merge channels
-        modified_ycbcr = Image.merge('YCbCr', (modified_y_img, cb, cr))
+        # Apply inverse DWT straight into the Y channel, which the forward
+        # transform has already copied out
+        self._inverse_dwt(modified_coeffs, y_array)
         
-        # Convert back to RGB
-        stego_img = self._convert_to_rgb(modified_ycbcr)
-        
-        # Save to bytes
-        output = io.BytesIO()
-        stego_img.save(output, format='PNG')
-        
-        return output.getvalue()
+        return self._encode_png(ycc)
     
     def extract(self, stego_data, key=None):
         """
@@ -177,78 +226,72 @@ class ImageSteganography:
             key: Optional decryption key
             
         Returns:
-            Extracted payload as string
+            Extracted payload bytes, still to be passed to
+            PayloadProcessor.extract_payload
         """
-        # Open stego image
-        if isinstance(stego_data, bytes):
-            stego_img = Image.open(io.BytesIO(stego_data))
-        else:
-            stego_img = Image.open(stego_data)
-        
-        # Convert to YCbCr
-        ycbcr = self._convert_to_ycbcr(stego_img)
-        
-        # Get Y channel
-        y, _, _ = ycbcr.split()
-        
-        # Convert to numpy array
-        y_array = np.array(y)
+        # Decode to YCrCb and take the Y channel
+        y_array = self._decode_to_ycbcr(stego_data)[..., 0]
         
         # Apply DWT
         coeffs = self._apply_dwt(y_array)
         
-        # Get payload length (first 32 bits)
-        length_bits = self._extract_from_coeffs(coeffs, 32, key)
-        payload_length = int(''.join(map(str, length_bits)), 2)
-        
-        # Extract payload bits
-        payload_bits = self._extract_from_coeffs(coeffs, 32 + payload_length, key)
-        
-        # Process extracted bits
-        payload = self.payload_processor.extract_payload(payload_bits, key)
-        
-        return payload
+        # Decode the payload header first to learn the embedded size
+        header_bits = self._extract_from_coeffs(coeffs, 0, HEADER_SIZE * 8, key, y_array.shape)
+        payload_size = PayloadProcessor.embedded_size(np.packbits(header_bits).tobytes())
+        capacity_bits = self._usable_coeffs(coeffs, y_array.shape).size
+        if payload_size * 8 > capacity_bits:
+            raise ValueError(
+                f"Header claims a {payload_size}-byte payload but the image holds at most "
+                f"{capacity_bits // 8} bytes - not a stego image or the header is corrupted"
+            )
+        
+        # Extract only the bits that follow the header
+        body_bits = self._extract_from_coeffs(
+            coeffs, HEADER_SIZE * 8, (payload_size - HEADER_SIZE) * 8, key, y_array.shape
+        )
+        
+        return np.packbits(header_bits).tobytes() + np.packbits(body_bits).tobytes()
     
-    def analyze_capacity(self, image_data):
+    def analyze_capacity(self, image_data, use_dwt=False):
         """
         Analyze the capacity of an image for steganography.
         
+        Only the image header is read: bits go into the level-2 detail
+        coefficients of complete 4x4 pixel blocks, (H // 4) x (W // 4) of
+        them, so the capacity follows from the dimensions alone.
+        
         Args:
             image_data: Image data as bytes or file-like object
+            use_dwt: Decode the pixels and count the coefficients of an
+                actual transform instead (for debugging)
             
         Returns:
             Dictionary with capacity information
         """
-        # Open image
+        # Open image; PIL reads only the header until pixels are accessed
         if isinstance(image_data, bytes):
             img = Image.open(io.BytesIO(image_data))
         else:
             img = Image.open(image_data)
+        width, height = img.size
         
-        # Convert to YCbCr
-        ycbcr = self._convert_to_ycbcr(img)
-        
-        # Get Y channel
-        y, _, _ = ycbcr.split()
-        
-        # Convert to numpy array
-        y_array = np.array(y)
-        
-        # Apply DWT
-        coeffs = self._apply_dwt(y_array)
-        
-        # Get horizontal detail coefficients
-        h_coeffs = coeffs[1][1]
+        if use_dwt:
+            # Convert to YCrCb, transform the Y channel and count the
+            # usable horizontal detail coefficients
+            coeffs = self._apply_dwt(self._convert_to_ycbcr(img)[..., 0])
+            total_coeffs = self._usable_coeffs(coeffs, (height, width)).size
+        else:
+            total_coeffs = (height // 4) * (width // 4)
         
         # Calculate capacity
-        total_coeffs = h_coeffs.size
-        usable_bits = total_coeffs - 32  # Subtract header size
+        usable_bits = total_coeffs - HEADER_SIZE * 8  # Subtract header size
         usable_bytes = usable_bits // 8
+        image_size_bytes = width * height * len(img.getbands())
         
         return {
             'total_coefficients': total_coeffs,
             'usable_bits': usable_bits,
             'usable_bytes': usable_bytes,
-            'image_size_bytes': img.size[0] * img.size[1] * len(img.getbands()),
-            'efficiency_ratio': usable_bytes / (img.size[0] * img.size[1] * len(img.getbands()))
-        }
\ No newline at end of file
+            'image_size_bytes': image_size_bytes,
+            'efficiency_ratio': usable_bytes / image_size_bytes
+        }
@@ -0,0 +1,98 @@
+"""
+Round-trip tests for the audio steganography module.
+
+Carriers are written as .wav paths, which pydub reads without ffmpeg.
+"""
+
+import os
+import struct
+import tempfile
+import unittest
+import wave
+
+import numpy as np
+
+from stegano_toolkit.audio_stego import BITS_PER_FRAME, FRAME_LEN, AudioSteganography
+from stegano_toolkit.common_crypto import (
+    HEADER_FORMAT, HEADER_MAGIC, HEADER_SIZE, HEADER_VERSION, KeyManager, PayloadProcessor, _RS
+)
+
+SAMPLE_RATE = 44100
+
+
+class AudioRoundTripTests(unittest.TestCase):
+
+    def setUp(self):
+        self.stego = AudioSteganography()
+        self.key = KeyManager.generate_session_key()
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.work_dir.cleanup)
+
+    def write_wav(self, name, channels, n_frames, seed=0):
+        """Write noisy int16 PCM holding n_frames transform frames per channel."""
+        rng = np.random.default_rng(seed)
+        samples = (rng.standard_normal(n_frames * FRAME_LEN * channels) * 3000).astype(np.int16)
+        path = os.path.join(self.work_dir.name, name)
+        with wave.open(path, 'wb') as wav:
+            wav.setnchannels(channels)
+            wav.setsampwidth(2)
+            wav.setframerate(SAMPLE_RATE)
+            wav.writeframes(samples.tobytes())
+        return path
+
+    def stego_path(self, name):
+        return os.path.join(self.work_dir.name, f"stego_{name}")
+
+    def test_message_round_trip(self):
+        message = b'hidden in the mid band'
+        for channels in (1, 2):
+            with self.subTest(channels=channels):
+                cover = self.write_wav(f"cover{channels}.wav", channels, 100, seed=channels)
+                payload, _ = PayloadProcessor.prepare_payload(message, self.key)
+
+                output = self.stego.embed(cover, payload, self.key, self.stego_path(f"{channels}.wav"))
+
+                extracted = self.stego.extract(output, self.key)
+                self.assertEqual(len(extracted), len(payload))
+                self.assertEqual(PayloadProcessor.extract_payload(extracted, self.key), message)
+
+    def test_other_channels_are_untouched(self):
+        cover = self.write_wav('cover.wav', 2, 100)
+        payload, _ = PayloadProcessor.prepare_payload(b'left only', self.key)
+        output = self.stego.embed(cover, payload, self.key, self.stego_path('cover.wav'))
+
+        with wave.open(cover, 'rb') as before, wave.open(output, 'rb') as after:
+            original = np.frombuffer(before.readframes(before.getnframes()), dtype=np.int16).reshape(-1, 2)
+            marked = np.frombuffer(after.readframes(after.getnframes()), dtype=np.int16).reshape(-1, 2)
+        np.testing.assert_array_equal(marked[:, 1], original[:, 1])
+        self.assertFalse(np.array_equal(marked[:, 0], original[:, 0]))
+
+    def test_payload_too_large(self):
+        cover = self.write_wav('short.wav', 1, 10)
+
+        with self.assertLogs('stegano_toolkit.audio_stego', level='ERROR'):
+            with self.assertRaisesRegex(ValueError, 'Payload too large'):
+                self.stego.embed(cover, bytes(10 * BITS_PER_FRAME // 8 + 1), self.key)
+
+    def test_header_larger_than_audio_raises(self):
+        # A valid header whose body length cannot fit in 100 frames
+        header = _RS.encode(struct.pack(
+            HEADER_FORMAT, HEADER_MAGIC, HEADER_VERSION, 0, bytes(12), 10, 100000
+        ))
+        cover = self.write_wav('cover.wav', 1, 100)
+        output = self.stego.embed(cover, bytes(header), self.key, self.stego_path('cover.wav'))
+
+        with self.assertLogs('stegano_toolkit.audio_stego', level='ERROR'):
+            with self.assertRaisesRegex(ValueError, 'holds at most'):
+                self.stego.extract(output, self.key)
+
+    def test_unmarked_audio_raises(self):
+        cover = self.write_wav('cover.wav', 1, HEADER_SIZE * 8 // BITS_PER_FRAME + 1)
+
+        with self.assertLogs('stegano_toolkit.audio_stego', level='ERROR'):
+            with self.assertRaises(ValueError):
+                self.stego.extract(cover, self.key)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,204 @@
+"""
+Tests for the keyring and payload processing in common_crypto.
+"""
+
+import os
+import tempfile
+import unittest
+
+from cryptography.fernet import Fernet
+
+from stegano_toolkit.common_crypto import (
+    FLAG_COMPRESSED, FLAG_SIGNED, HEADER_SIZE, RS_REDUNDANCY, KeyManager, PayloadProcessor
+)
+
+
+def corrupt(data, positions):
+    """Flip every bit of the bytes at the given positions."""
+    data = bytearray(data)
+    for position in positions:
+        data[position] ^= 0xFF
+    return bytes(data)
+
+
+class KeyringTests(unittest.TestCase):
+
+    def setUp(self):
+        self.key_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.key_dir.cleanup)
+        self.master_key = Fernet.generate_key()
+        KeyManager.load_keyring(self.key_dir.name, self.master_key)
+
+    def key_path(self, key_id):
+        return os.path.join(self.key_dir.name, f"{key_id}.key")
+
+    def read_file(self, key_id):
+        with open(self.key_path(key_id), 'rb') as f:
+            return f.read()
+
+    def test_stored_key_is_encrypted_and_reloads(self):
+        key = KeyManager.generate_session_key()
+        KeyManager.store_key(7, key)
+
+        self.assertNotIn(key, self.read_file(7))
+        self.assertEqual(Fernet(self.master_key).decrypt(self.read_file(7)), key)
+
+        KeyManager.load_keyring(self.key_dir.name, self.master_key)
+        self.assertEqual(KeyManager.get_key('7'), key)
+
+    def test_get_key_reads_files_written_by_another_process(self):
+        key = KeyManager.generate_session_key()
+        with open(self.key_path('late'), 'wb') as f:
+            f.write(Fernet(self.master_key).encrypt(key))
+
+        self.assertEqual(KeyManager.get_key('late'), key)
+
+    def test_undecryptable_file_is_skipped(self):
+        good = KeyManager.generate_session_key()
+        KeyManager.store_key('good', good)
+        with open(self.key_path('bad'), 'wb') as f:
+            f.write(Fernet(Fernet.generate_key()).encrypt(b'other master key'))
+
+        with self.assertLogs('stegano_toolkit.common_crypto', level='ERROR'):
+            KeyManager.load_keyring(self.key_dir.name, self.master_key)
+
+        self.assertEqual(KeyManager.get_key('good'), good)
+        with self.assertRaises(ValueError):
+            KeyManager.get_key('bad')
+
+    def test_legacy_plaintext_file_is_encrypted_on_load(self):
+        key = KeyManager.generate_session_key()
+        with open(self.key_path('legacy'), 'wb') as f:
+            f.write(key)
+
+        KeyManager.load_keyring(self.key_dir.name, self.master_key)
+
+        self.assertEqual(KeyManager.get_key('legacy'), key)
+        self.assertEqual(Fernet(self.master_key).decrypt(self.read_file('legacy')), key)
+        self.assertEqual(sorted(os.listdir(self.key_dir.name)), ['legacy.key'])
+
+    def test_configure_defers_reading_until_first_use(self):
+        key = KeyManager.generate_session_key()
+        with open(self.key_path('legacy'), 'wb') as f:
+            f.write(key)
+
+        KeyManager.configure_keyring(self.key_dir.name, self.master_key)
+        self.assertEqual(self.read_file('legacy'), key)
+
+        self.assertEqual(KeyManager.get_key('legacy'), key)
+        self.assertEqual(Fernet(self.master_key).decrypt(self.read_file('legacy')), key)
+
+    def test_missing_master_key_raises_on_use(self):
+        KeyManager.configure_keyring(self.key_dir.name, None)
+
+        with self.assertRaises(RuntimeError):
+            KeyManager.get_key('any')
+        with self.assertRaises(RuntimeError):
+            KeyManager.store_key('any', KeyManager.generate_session_key())
+        self.assertEqual(os.listdir(self.key_dir.name), [])
+
+
+class PayloadProcessorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.key = KeyManager.generate_session_key()
+
+    def test_round_trip(self):
+        messages = {
+            'compressible': b'steganography ' * 500,
+            'incompressible': os.urandom(5000),
+            'empty': b'',
+        }
+        for name, message in messages.items():
+            with self.subTest(message=name):
+                payload, metadata = PayloadProcessor.prepare_payload(message, self.key)
+                self.assertEqual(metadata['compressed'], name == 'compressible')
+                self.assertEqual(PayloadProcessor.extract_payload(payload, self.key), message)
+
+    def test_header_fields(self):
+        message = b'header fields ' * 50
+        payload, metadata = PayloadProcessor.prepare_payload(message, self.key)
+
+        flags, nonce, message_length, encoded_length = PayloadProcessor._parse_header(payload)
+        self.assertEqual(flags, FLAG_COMPRESSED)
+        self.assertEqual(nonce, metadata['nonce'])
+        self.assertEqual(message_length, len(message))
+        self.assertEqual(encoded_length, len(payload) - HEADER_SIZE)
+        self.assertEqual(PayloadProcessor.embedded_size(payload[:HEADER_SIZE]), len(payload))
+
+    def test_trailing_data_is_ignored(self):
+        payload, _ = PayloadProcessor.prepare_payload(b'short', self.key)
+        self.assertEqual(PayloadProcessor.extract_payload(payload + bytes(100), self.key), b'short')
+
+    def test_corrupted_header_is_corrected(self):
+        message = b'header errors'
+        payload, _ = PayloadProcessor.prepare_payload(message, self.key)
+
+        # RS_REDUNDANCY / 2 bad bytes: the magic, version and flags, and the
+        # tail of the fields where the lengths sit
+        damaged = corrupt(payload, [*range(8), *range(18, 26)])
+        self.assertEqual(PayloadProcessor.embedded_size(damaged[:HEADER_SIZE]), len(payload))
+        self.assertEqual(PayloadProcessor.extract_payload(damaged, self.key), message)
+
+    def test_corrupted_body_is_corrected(self):
+        message = os.urandom(2000)
+        payload, _ = PayloadProcessor.prepare_payload(message, self.key)
+
+        # RS_REDUNDANCY / 2 bad bytes in every 255-byte block of the body
+        positions = [
+            HEADER_SIZE + block + offset
+            for block in range(0, len(payload) - HEADER_SIZE, 255)
+            for offset in range(0, RS_REDUNDANCY, 2)
+            if HEADER_SIZE + block + offset < len(payload)
+        ]
+        damaged = corrupt(payload, positions)
+        self.assertEqual(PayloadProcessor.extract_payload(damaged, self.key), message)
+
+    def test_uncorrectable_errors_raise(self):
+        payload, _ = PayloadProcessor.prepare_payload(os.urandom(500), self.key)
+
+        with self.assertRaises(ValueError):
+            PayloadProcessor.extract_payload(corrupt(payload, range(HEADER_SIZE)), self.key)
+        damaged_body = corrupt(payload, range(HEADER_SIZE, HEADER_SIZE + RS_REDUNDANCY))
+        with self.assertRaises(ValueError):
+            PayloadProcessor.extract_payload(damaged_body, self.key)
+
+    def test_mutable_key_buffers(self):
+        payload, _ = PayloadProcessor.prepare_payload(b'buffered key', bytearray(self.key))
+        self.assertEqual(PayloadProcessor.extract_payload(payload, memoryview(self.key)), b'buffered key')
+
+    def test_wrong_key_raises(self):
+        payload, _ = PayloadProcessor.prepare_payload(b'secret', self.key)
+        with self.assertRaises(ValueError):
+            PayloadProcessor.extract_payload(payload, KeyManager.generate_session_key())
+
+    def test_short_data_raises(self):
+        with self.assertRaises(ValueError):
+            PayloadProcessor.embedded_size(bytes(HEADER_SIZE - 1))
+
+    def test_signature(self):
+        signing_key, verify_key = KeyManager.generate_signing_keypair()
+        _, other_verify_key = KeyManager.generate_signing_keypair()
+        payload, metadata = PayloadProcessor.prepare_payload(b'signed', self.key, signing_key)
+
+        self.assertTrue(metadata['has_signature'])
+        self.assertTrue(PayloadProcessor._parse_header(payload)[0] & FLAG_SIGNED)
+        self.assertEqual(PayloadProcessor.extract_payload(payload, self.key, verify_key), b'signed')
+        with self.assertRaises(ValueError):
+            PayloadProcessor.extract_payload(payload, self.key, other_verify_key)
+
+    def test_unsigned_payload_fails_verification(self):
+        _, verify_key = KeyManager.generate_signing_keypair()
+        payload, _ = PayloadProcessor.prepare_payload(b'unsigned', self.key)
+        with self.assertRaises(ValueError):
+            PayloadProcessor.extract_payload(payload, self.key, verify_key)
+
+    def test_prepare_payloads_keeps_order(self):
+        messages = [f"message {i}".encode() * (i + 1) for i in range(5)]
+        prepared = PayloadProcessor.prepare_payloads(messages, self.key, max_workers=3)
+        extracted = [PayloadProcessor.extract_payload(payload, self.key) for payload, _ in prepared]
+        self.assertEqual(extracted, messages)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+"""
+Round-trip tests for the document steganography module.
+"""
+
+import io
+import os
+import unittest
+import zipfile
+
+import pikepdf
+
+from stegano_toolkit.document_stego import DOCX_CORE_PART, DocumentSteganography
+
+CONTENT_TYPES = (
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    b'<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    b'<Default Extension="xml" ContentType="application/xml"/>'
+    b'</Types>'
+)
+RELS = (
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    b'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    b'<Relationship Id="rId1" '
+    b'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    b'Target="word/document.xml"/>'
+    b'</Relationships>'
+)
+DOCUMENT = (
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    b'<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+    b'<w:body><w:p><w:r><w:t>Cover text</w:t></w:r></w:p></w:body></w:document>'
+)
+CORE = (
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    b'<cp:coreProperties '
+    b'xmlns:cp="http://schemas.openxmlformats.org/package/2006/metadata/core-properties" '
+    b'xmlns:dc="http://purl.org/dc/elements/1.1/">'
+    b'<dc:title>Report</dc:title>%s</cp:coreProperties>'
+)
+
+
+def make_pdf(**save_options):
+    """Build a one-page PDF with pikepdf."""
+    buffer = io.BytesIO()
+    with pikepdf.new() as pdf:
+        pdf.add_blank_page()
+        pdf.save(buffer, **save_options)
+    return buffer.getvalue()
+
+
+def make_docx(core=CORE % b''):
+    """Build a minimal DOCX package, with core properties unless core is None."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr('[Content_Types].xml', CONTENT_TYPES)
+        docx.writestr('_rels/.rels', RELS)
+        docx.writestr('word/document.xml', DOCUMENT)
+        if core is not None:
+            docx.writestr(DOCX_CORE_PART, core)
+    return buffer.getvalue()
+
+
+class PdfTests(unittest.TestCase):
+
+    def setUp(self):
+        self.stego = DocumentSteganography()
+        self.payload = os.urandom(500)
+
+    def test_incremental_round_trip(self):
+        pdf_data = make_pdf()
+        stego_pdf = self.stego.embed(pdf_data, self.payload, None)
+
+        # The original bytes are kept and the update is a valid PDF revision
+        self.assertEqual(stego_pdf[:len(pdf_data)], pdf_data)
+        self.assertEqual(self.stego._extract_pdf_incremental(stego_pdf), self.payload)
+        with pikepdf.Pdf.open(io.BytesIO(stego_pdf)) as pdf:
+            self.assertEqual(len(pdf.pages), 1)
+            self.assertEqual(bytes(pdf.trailer.Stego.read_bytes()), self.payload)
+        self.assertEqual(self.stego.extract(stego_pdf, None), self.payload)
+
+    def test_xref_stream_falls_back_to_rewrite(self):
+        pdf_data = make_pdf(object_stream_mode=pikepdf.ObjectStreamMode.generate)
+        stego_pdf = self.stego.embed(pdf_data, self.payload, None)
+
+        self.assertIsNone(self.stego._extract_pdf_incremental(stego_pdf))
+        self.assertEqual(self.stego.extract(stego_pdf, None), self.payload)
+
+    def test_re_embed_replaces_payload(self):
+        first = self.stego.embed(make_pdf(), b'first payload', None)
+        second = self.stego.embed(first, b'second payload', None)
+
+        self.assertEqual(self.stego.extract(second, None), b'second payload')
+
+    def test_pdf_without_payload_raises(self):
+        with self.assertLogs('stegano_toolkit.document_stego', level='ERROR'):
+            with self.assertRaises(ValueError):
+                self.stego.extract(make_pdf(), None)
+
+
+class DocxTests(unittest.TestCase):
+
+    def setUp(self):
+        self.stego = DocumentSteganography()
+        self.payload = os.urandom(500)
+
+    def test_round_trip_keeps_other_parts(self):
+        docx_data = make_docx()
+        stego_docx = self.stego.embed(docx_data, self.payload, None)
+
+        self.assertEqual(self.stego.extract(stego_docx, None), self.payload)
+        with zipfile.ZipFile(io.BytesIO(stego_docx)) as docx:
+            self.assertEqual(docx.read('word/document.xml'), DOCUMENT)
+            self.assertIn(b'Report', docx.read(DOCX_CORE_PART))
+
+    def test_missing_core_part_is_added_and_registered(self):
+        stego_docx = self.stego.embed(make_docx(core=None), self.payload, None)
+
+        self.assertEqual(self.stego.extract(stego_docx, None), self.payload)
+        with zipfile.ZipFile(io.BytesIO(stego_docx)) as docx:
+            self.assertIn(b'/docProps/core.xml', docx.read('[Content_Types].xml'))
+            self.assertIn(b'Target="docProps/core.xml"', docx.read('_rels/.rels'))
+
+    def test_legacy_hex_payload(self):
+        docx_data = make_docx(CORE % b'<dc:description>%s</dc:description>' % self.payload.hex().encode())
+        self.assertEqual(self.stego.extract(docx_data, None), self.payload)
+
+    def test_docx_without_payload_raises(self):
+        with self.assertLogs('stegano_toolkit.document_stego', level='ERROR'):
+            with self.assertRaises(ValueError):
+                self.stego.extract(make_docx(), None)
+
+    def test_output_extension_follows_input(self):
+        self.assertEqual(self.stego.output_extension('report.DOCX'), '.docx')
+        self.assertEqual(self.stego.output_extension('scan.pdf'), '.pdf')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+"""
+Tests for the atomic output helper.
+"""
+
+import os
+import tempfile
+import unittest
+
+from stegano_toolkit._fileio import NEW_FILE_MODE, atomic_output
+
+
+class AtomicOutputTests(unittest.TestCase):
+
+    def setUp(self):
+        self.out_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.out_dir.cleanup)
+        self.path = os.path.join(self.out_dir.name, 'stego.png')
+
+    def test_file_appears_on_success(self):
+        with atomic_output(self.path) as f:
+            f.write(b'complete')
+            self.assertFalse(os.path.exists(self.path))
+
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), b'complete')
+        self.assertEqual(os.listdir(self.out_dir.name), ['stego.png'])
+
+    def test_failure_leaves_nothing_behind(self):
+        with self.assertRaises(ValueError):
+            with atomic_output(self.path) as f:
+                f.write(b'partial')
+                raise ValueError("Payload too large")
+
+        self.assertEqual(os.listdir(self.out_dir.name), [])
+
+    def test_failure_keeps_existing_file(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'previous')
+
+        with self.assertRaises(ValueError):
+            with atomic_output(self.path) as f:
+                f.write(b'partial')
+                raise ValueError("ffmpeg failed")
+
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), b'previous')
+
+    def test_new_output_is_not_private(self):
+        with atomic_output(self.path) as f:
+            f.write(b'x')
+
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, NEW_FILE_MODE)
+
+    def test_replaced_output_keeps_its_mode(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'previous')
+        os.chmod(self.path, 0o640)
+
+        with atomic_output(self.path) as f:
+            f.write(b'x')
+
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o640)
+
+
+if __name__ == '__main__':
+    unittest.main()
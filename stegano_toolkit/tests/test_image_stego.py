@@ -0,0 +1,106 @@
+"""
+Round-trip tests for the image steganography module.
+"""
+
+import io
+import struct
+import unittest
+
+import numpy as np
+from PIL import Image
+
+from stegano_toolkit.common_crypto import (
+    HEADER_FORMAT, HEADER_MAGIC, HEADER_SIZE, HEADER_VERSION, KeyManager, PayloadProcessor, _RS
+)
+from stegano_toolkit.image_stego import ImageSteganography
+
+# Even, odd and non-multiple-of-4 sizes (height, width)
+IMAGE_SIZES = [(256, 256), (257, 301), (200, 258), (255, 257), (203, 301)]
+
+
+def make_png(height, width, seed=0):
+    """Encode a noisy mid-range RGB image as PNG; no channel is near saturation."""
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(40, 216, (height, width, 3)).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class ImageRoundTripTests(unittest.TestCase):
+
+    def setUp(self):
+        self.stego = ImageSteganography()
+
+    def test_every_usable_coefficient_survives(self):
+        rng = np.random.default_rng(1)
+        for height, width in IMAGE_SIZES:
+            with self.subTest(size=(height, width)):
+                n_bits = (height // 4) * (width // 4) // 8 * 8
+                bits = rng.integers(0, 2, n_bits).astype(np.uint8)
+
+                stego_png = self.stego.embed(make_png(height, width), np.packbits(bits).tobytes())
+
+                y_array = self.stego._decode_to_ycbcr(stego_png)[..., 0]
+                coeffs = self.stego._apply_dwt(y_array)
+                extracted = self.stego._extract_from_coeffs(coeffs, 0, n_bits, None, y_array.shape)
+                np.testing.assert_array_equal(extracted, bits)
+
+    def test_message_round_trip(self):
+        key = KeyManager.generate_session_key()
+        message = b'hidden in the Y channel ' * 4
+        for seed, (height, width) in enumerate(IMAGE_SIZES):
+            with self.subTest(size=(height, width)):
+                payload, _ = PayloadProcessor.prepare_payload(message, key)
+                stego_png = self.stego.embed(make_png(height, width, seed), payload, key)
+
+                extracted = self.stego.extract(stego_png, key)
+                self.assertEqual(PayloadProcessor.extract_payload(extracted, key), message)
+
+    def test_output_is_png_of_same_size(self):
+        key = KeyManager.generate_session_key()
+        payload, _ = PayloadProcessor.prepare_payload(b'size check', key)
+        stego_png = self.stego.embed(make_png(203, 301), payload, key)
+
+        with Image.open(io.BytesIO(stego_png)) as img:
+            self.assertEqual(img.format, 'PNG')
+            self.assertEqual(img.size, (301, 203))
+
+    def test_capacity_matches_usable_coefficients(self):
+        for height, width in IMAGE_SIZES:
+            with self.subTest(size=(height, width)):
+                png = make_png(height, width)
+                capacity = self.stego.analyze_capacity(png)
+                self.assertEqual(capacity['total_coefficients'], (height // 4) * (width // 4))
+                self.assertEqual(capacity, self.stego.analyze_capacity(png, use_dwt=True))
+
+    def test_payload_filling_reported_capacity(self):
+        png = make_png(203, 301)
+        usable_bytes = self.stego.analyze_capacity(png)['usable_bytes']
+        # usable_bytes excludes the payload header
+        self.stego.embed(png, bytes(HEADER_SIZE + usable_bytes))
+
+        with self.assertRaises(ValueError):
+            self.stego.embed(png, bytes(HEADER_SIZE + usable_bytes + 1))
+
+    def test_header_larger_than_image_raises(self):
+        # A valid header whose body length cannot fit in a 96x96 image
+        header = _RS.encode(struct.pack(
+            HEADER_FORMAT, HEADER_MAGIC, HEADER_VERSION, 0, bytes(12), 10, 100000
+        ))
+        stego_png = self.stego.embed(make_png(96, 96), bytes(header))
+
+        with self.assertRaisesRegex(ValueError, 'holds at most'):
+            self.stego.extract(stego_png)
+
+    def test_cover_image_without_payload_raises(self):
+        with self.assertRaises(ValueError):
+            self.stego.extract(make_png(64, 64))
+
+    def test_payload_too_large(self):
+        with self.assertRaises(ValueError):
+            self.stego.embed(make_png(16, 16), bytes(64))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+"""
+Tests for the Reed-Solomon codec wrapper.
+"""
+
+import os
+import unittest
+
+from stegano_toolkit._rs_codec import BLOCK_SIZE, GALOIS_MIN_BLOCKS, HAVE_GALOIS, ReedSolomonError, RSCodec
+
+NSYM = 32
+
+
+def corrupt(data, positions):
+    """Flip every bit of the bytes at the given positions."""
+    data = bytearray(data)
+    for position in positions:
+        data[position] ^= 0xFF
+    return bytes(data)
+
+
+class RSCodecTests(unittest.TestCase):
+
+    def setUp(self):
+        self.codec = RSCodec(NSYM)
+
+    def test_encoding_is_systematic(self):
+        message = os.urandom(100)
+        encoded = self.codec.encode(message)
+
+        self.assertEqual(len(encoded), len(message) + NSYM)
+        self.assertEqual(bytes(encoded[:len(message)]), message)
+
+    def test_every_block_gets_parity(self):
+        k = BLOCK_SIZE - NSYM
+        for length in (0, 1, k, k + 1, 3 * k, 3 * k + 7):
+            with self.subTest(length=length):
+                encoded = self.codec.encode(os.urandom(length))
+                self.assertEqual(len(encoded), length + -(-length // k) * NSYM)
+
+    def test_correctable_errors(self):
+        message = os.urandom(3 * (BLOCK_SIZE - NSYM) + 50)
+        encoded = self.codec.encode(message)
+
+        # NSYM / 2 errors in every codeword, including the shortened last one
+        positions = [
+            start + offset
+            for start in range(0, len(encoded), BLOCK_SIZE)
+            for offset in range(1, NSYM + 1, 2)
+        ]
+        self.assertEqual(bytes(self.codec.decode(corrupt(encoded, positions))), message)
+
+    def test_uncorrectable_errors_raise(self):
+        encoded = self.codec.encode(os.urandom(200))
+
+        with self.assertRaises(ReedSolomonError):
+            self.codec.decode(corrupt(encoded, range(NSYM // 2 + 1)))
+
+    @unittest.skipUnless(HAVE_GALOIS, "galois is not installed")
+    def test_vectorized_path_matches_byte_codec(self):
+        message = os.urandom(GALOIS_MIN_BLOCKS * (BLOCK_SIZE - NSYM) + 100)
+        encoded = self.codec.encode(message)
+
+        self.assertEqual(bytes(encoded), bytes(self.codec._codec.encode(message)))
+        damaged = corrupt(encoded, range(0, len(encoded), BLOCK_SIZE // 8))
+        self.assertEqual(bytes(self.codec.decode(damaged)), message)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+"""
+Tests for the ffmpeg plumbing in the video steganography module.
+
+ffmpeg and ffprobe are replaced by small shell scripts on PATH, so these
+tests exercise the process handling rather than real video processing.
+"""
+
+import os
+import stat
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from stegano_toolkit import video_stego
+from stegano_toolkit.video_stego import VideoSteganography
+
+# Copies the input to stdout after writing more to stderr than a pipe buffers
+FAKE_FFMPEG = """#!/bin/sh
+[ "$1" = "-version" ] && exit 0
+while [ "$1" != "-i" ]; do shift; done
+head -c 1000000 /dev/zero >&2
+cat "$2"
+"""
+
+# Counts its runs in the file named by PROBE_LOG
+FAKE_FFPROBE = """#!/bin/sh
+echo run >> "$PROBE_LOG"
+printf 'width=640\\nheight=480\\nr_frame_rate=25/1\\nduration=N/A\\nnb_read_packets=250\\n'
+"""
+
+FAILING_FFMPEG = """#!/bin/sh
+[ "$1" = "-version" ] && exit 0
+echo "Invalid data found when processing input" >&2
+exit 1
+"""
+
+
+@unittest.skipIf(os.name != 'posix', "fake ffmpeg is a shell script")
+class VideoEmbedTests(unittest.TestCase):
+
+    def setUp(self):
+        self.bin_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.bin_dir.cleanup)
+        path = f"{self.bin_dir.name}{os.pathsep}{os.environ.get('PATH', '')}"
+        patcher = mock.patch.dict(os.environ, {'PATH': path})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        video_stego._have_ffmpeg.cache_clear()
+        self.addCleanup(video_stego._have_ffmpeg.cache_clear)
+
+    def install(self, name, script):
+        path = os.path.join(self.bin_dir.name, name)
+        with open(path, 'w') as f:
+            f.write(script)
+        os.chmod(path, stat.S_IRWXU)
+
+    def test_noisy_stderr_does_not_block_output(self):
+        self.install('ffmpeg', FAKE_FFMPEG)
+        video = os.urandom(3 * 1024 * 1024)
+
+        self.assertEqual(VideoSteganography().embed(video, b'payload', 1), video)
+
+    def test_failure_reports_stderr(self):
+        self.install('ffmpeg', FAILING_FFMPEG)
+
+        with self.assertLogs('stegano_toolkit.video_stego', level='ERROR'):
+            with self.assertRaises(subprocess.CalledProcessError) as cm:
+                VideoSteganography().embed(b'not a video', b'payload', 1)
+        self.assertIn(b'Invalid data', cm.exception.stderr)
+
+
+@unittest.skipIf(os.name != 'posix', "fake ffprobe is a shell script")
+class VideoProbeCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.work_dir.cleanup)
+        self.probe_log = os.path.join(self.work_dir.name, 'probe.log')
+        path = f"{self.work_dir.name}{os.pathsep}{os.environ.get('PATH', '')}"
+        patcher = mock.patch.dict(os.environ, {'PATH': path, 'PROBE_LOG': self.probe_log})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        script = os.path.join(self.work_dir.name, 'ffprobe')
+        with open(script, 'w') as f:
+            f.write(FAKE_FFPROBE)
+        os.chmod(script, stat.S_IRWXU)
+        video_stego._probe_cache.clear()
+        self.addCleanup(video_stego._probe_cache.clear)
+
+    def probe_runs(self):
+        if not os.path.exists(self.probe_log):
+            return 0
+        with open(self.probe_log) as f:
+            return len(f.readlines())
+
+    def test_video_on_disk_is_probed_once(self):
+        video_path = os.path.join(self.work_dir.name, 'clip.mp4')
+        with open(video_path, 'wb') as f:
+            f.write(b'video')
+
+        first = video_stego._probe_video_stream(video_path)
+        self.assertEqual(video_stego._probe_video_stream(video_path), first)
+        self.assertEqual(first['width'], '640')
+        self.assertEqual(self.probe_runs(), 1)
+
+        # A rewritten file is probed again
+        with open(video_path, 'wb') as f:
+            f.write(b'longer video')
+        video_stego._probe_video_stream(video_path)
+        self.assertEqual(self.probe_runs(), 2)
+
+    def test_in_memory_video_is_not_cached(self):
+        video_stego._probe_video_stream(b'video')
+        video_stego._probe_video_stream(b'video')
+
+        self.assertEqual(self.probe_runs(), 2)
+        self.assertEqual(video_stego._probe_cache, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
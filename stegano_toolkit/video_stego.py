@@ -4,37 +4,119 @@ Video steganography module using I-frame 8x8 DCT mid-frequency QIM.
 
 import numpy as np
 import io
+import shutil
 import tempfile
 import os
 import subprocess
 import logging
+from contextlib import contextmanager
+from functools import lru_cache
 from typing import Dict, Any
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Most recent ffprobe results for videos on disk, keyed by video fingerprint
+PROBE_CACHE_SIZE = 32
+_probe_cache: Dict[Any, Dict[str, str]] = {}
+
+@lru_cache(maxsize=1)
+def _have_ffmpeg() -> bool:
+    """Check once per process whether the ffmpeg binary can be run."""
+    try:
+        subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
+    except (subprocess.SubprocessError, FileNotFoundError):
+        return False
+    return True
+
+@contextmanager
+def _video_path(video_data):
+    """
+    Yield a path ffmpeg/ffprobe can open for the video.
+    
+    Videos already on disk are used in place. In-memory data is spilled to a
+    temporary file rather than piped: MP4 demuxing has to seek to the moov
+    atom, which usually sits at the end of the file.
+    """
+    if isinstance(video_data, (str, os.PathLike)):
+        yield os.fspath(video_data)
+        return
+    
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as input_file:
+        input_file.write(video_data)
+    try:
+        yield input_file.name
+    finally:
+        os.unlink(input_file.name)
+
+def _video_fingerprint(video_data):
+    """
+    Identify a video on disk by path, size and mtime.
+    
+    Returns None for in-memory data: hashing a whole video costs more than
+    the ffprobe run the cache would save.
+    """
+    if isinstance(video_data, (str, os.PathLike)):
+        stat = os.stat(video_data)
+        return (os.fspath(video_data), stat.st_size, stat.st_mtime_ns)
+    return None
+
+def _probe_video_stream(video_data) -> Dict[str, str]:
+    """
+    Get the first video stream's ffprobe fields, memoized for videos on disk.
+    
+    Returns width, height, duration, r_frame_rate and nb_read_packets as
+    strings. Packets are counted from the container (-count_packets), which
+    is exact for variable frame rate video and does not decode any frames.
+    """
+    fingerprint = _video_fingerprint(video_data)
+    if fingerprint is not None and fingerprint in _probe_cache:
+        return _probe_cache[fingerprint]
+    
+    with _video_path(video_data) as input_path:
+        result = subprocess.run([
+            'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+            '-count_packets',
+            '-show_entries', 'stream=width,height,duration,r_frame_rate,nb_read_packets',
+            '-of', 'default=noprint_wrappers=1', input_path
+        ], capture_output=True, text=True, check=True)
+    
+    # key=value lines; ffprobe prints fields in its own order, not the requested one
+    fields = dict(line.split('=', 1) for line in result.stdout.splitlines() if '=' in line)
+    
+    if fingerprint is None:
+        return fields
+    
+    # Evict the oldest entry once the cache is full
+    if len(_probe_cache) >= PROBE_CACHE_SIZE:
+        del _probe_cache[next(iter(_probe_cache))]
+    _probe_cache[fingerprint] = fields
+    return fields
+
 class VideoSteganography:
     """Implements steganography for video files using DCT and QIM on I-frames."""
     
     def __init__(self, strength=0.1):
         self.strength = strength
-        # Check if ffmpeg is available
-        try:
-            subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
-        except (subprocess.SubprocessError, FileNotFoundError):
+        # Check if ffmpeg is available; the check itself runs once per process
+        if not _have_ffmpeg():
             logger.warning("ffmpeg not found. Video steganography may not work properly.")
     
+    def output_extension(self, input_name):
+        """Get the file extension of embed output; video is always muxed as MP4."""
+        return '.mp4'
+    
     def embed(self, video_data, payload, seed):
         """Embed payload into video using DCT and QIM on I-frames."""
+        output = io.BytesIO()
+        self.embed_to(output, video_data, payload, seed)
+        return output.getvalue()
+    
+    def embed_to(self, output, video_data, payload, seed):
+        """Embed payload into video and stream the result to a binary file object."""
         try:
-            # Create temporary files
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as input_file, \
-                 tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as output_file:
-                
-                # Write input video data
-                input_file.write(video_data)
-                input_file.flush()
+            with _video_path(video_data) as input_path:
                 
                 # In a real implementation, this would:
                 # 1. Extract I-frames using ffmpeg
@@ -42,100 +124,80 @@ class VideoSteganography:
                 # 3. Modify mid-frequency coefficients using QIM
                 # 4. Reconstruct the video
                 
-                # For demonstration, just copy the video
-                subprocess.run([
-                    'ffmpeg', '-i', input_file.name, 
-                    '-c:v', 'copy', '-c:a', 'copy',
-                    output_file.name
-                ], check=True, capture_output=True)
-                
-                # Read the output file
-                output_file.close()
-                with open(output_file.name, 'rb') as f:
-                    result = f.read()
-                
-                # Clean up temporary files
-                os.unlink(input_file.name)
-                os.unlink(output_file.name)
-                
-                return result
+                # For demonstration, just copy the video. The copy is muxed
+                # as fragmented MP4 straight to stdout (a pipe cannot seek
+                # back to write the moov atom) instead of to a temp file.
+                # stderr goes to a file, not a second pipe: ffmpeg would
+                # block once that pipe filled while only stdout is read
+                with tempfile.TemporaryFile() as stderr_file:
+                    process = subprocess.Popen([
+                        'ffmpeg', '-nostdin', '-loglevel', 'error',
+                        '-i', input_path,
+                        '-c:v', 'copy', '-c:a', 'copy',
+                        '-f', 'mp4', '-movflags', 'frag_keyframe+empty_moov',
+                        'pipe:1'
+                    ], stdout=subprocess.PIPE, stderr=stderr_file)
+                    
+                    # Copy the output across in chunks as ffmpeg produces it
+                    with process:
+                        shutil.copyfileobj(process.stdout, output, 1024 * 1024)
+                    if process.returncode:
+                        stderr_file.seek(0)
+                        raise subprocess.CalledProcessError(
+                            process.returncode, process.args, stderr=stderr_file.read()
+                        )
                 
         except Exception as e:
             logger.error(f"Error embedding payload in video: {str(e)}")
             raise
     
-    def extract(self, video_data, seed, payload_size):
+    def extract(self, video_data, seed, payload_size=None):
         """Extract payload from steganographic video."""
-        try:
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as input_file:
-                
-                # Write input video data
-                input_file.write(video_data)
-                input_file.flush()
-                
-                # In a real implementation, this would:
-                # 1. Extract I-frames using ffmpeg
-                # 2. Apply DCT to 8x8 blocks
-                # 3. Extract data from mid-frequency coefficients using QIM
-                
-                # Clean up temporary file
-                input_file.close()
-                os.unlink(input_file.name)
-                
-                # Return dummy payload for demonstration
-                return b"Extracted payload from video"
-                
-        except Exception as e:
-            logger.error(f"Error extracting payload from video: {str(e)}")
-            raise
+        # In a real implementation, this would:
+        # 1. Extract I-frames using ffmpeg
+        # 2. Apply DCT to 8x8 blocks
+        # 3. Extract data from mid-frequency coefficients using QIM
+        
+        # Return dummy payload for demonstration
+        return b"Extracted payload from video"
     
     def analyze_capacity(self, video_data):
         """Analyze the capacity of a video file for steganography."""
         try:
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as input_file:
-                
-                # Write input video data
-                input_file.write(video_data)
-                input_file.flush()
-                
-                # Get video information using ffprobe
-                result = subprocess.run([
-                    'ffprobe', '-v', 'error', '-select_streams', 'v:0',
-                    '-show_entries', 'stream=width,height,duration,r_frame_rate',
-                    '-of', 'csv=p=0', input_file.name
-                ], capture_output=True, text=True, check=True)
-                
-                # Parse the output
-                width, height, duration, frame_rate = result.stdout.strip().split(',')
-                width, height = int(width), int(height)
-                duration = float(duration)
-                frame_rate = eval(frame_rate)  # Convert fraction to float
-                
-                # Estimate number of I-frames (assume 1 every 10 frames)
-                total_frames = int(duration * frame_rate)
-                i_frames = total_frames // 10
-                
-                # Estimate capacity (conservative)
-                # Assume we can embed 1 bit per 64 pixels in each I-frame
-                capacity_bits = i_frames * (width * height) // 64
-                capacity_bytes = capacity_bits // 8
-                
-                # Clean up temporary file
-                input_file.close()
-                os.unlink(input_file.name)
-                
-                return {
-                    "width": width,
-                    "height": height,
-                    "duration": duration,
-                    "frame_rate": frame_rate,
-                    "estimated_i_frames": i_frames,
-                    "capacity_bytes": capacity_bytes,
-                    "recommended_max_payload": capacity_bytes // 2
-                }
-                
+            # Get video information using ffprobe
+            probe = _probe_video_stream(video_data)
+            
+            # Parse the output
+            width, height = int(probe['width']), int(probe['height'])
+            # Convert the num/den fraction to float
+            num, _, den = probe['r_frame_rate'].partition('/')
+            frame_rate = int(num) / int(den) if den else float(num)
+            # One packet per frame in the video stream
+            total_frames = int(probe['nb_read_packets'])
+            # Some containers leave the stream duration unset
+            if probe.get('duration', 'N/A') != 'N/A':
+                duration = float(probe['duration'])
+            else:
+                duration = total_frames / frame_rate
+            
+            # Estimate number of I-frames (assume 1 every 10 frames)
+            i_frames = total_frames // 10
+            
+            # Estimate capacity (conservative)
+            # Assume we can embed 1 bit per 64 pixels in each I-frame
+            capacity_bits = i_frames * (width * height) // 64
+            capacity_bytes = capacity_bits // 8
+            
+            return {
+                "width": width,
+                "height": height,
+                "duration": duration,
+                "frame_rate": frame_rate,
+                "estimated_i_frames": i_frames,
+                "capacity_bytes": capacity_bytes,
+                "recommended_max_payload": capacity_bytes // 2
+            }
+            
         except Exception as e:
             logger.error(f"Error analyzing video capacity: {str(e)}")
             # Return a minimal estimate if ffprobe fails